@@ -1,7 +1,7 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from datetime import datetime
-from pymongo import DESCENDING, MongoClient, ReturnDocument
+from pymongo import DESCENDING, ReturnDocument
 from dotenv import load_dotenv
 import os,re
 import smtplib
@@ -18,11 +18,9 @@ CORS(app, origins=["https://chess-main.vercel.app","https://chessdemo-alpha.verc
 
 load_dotenv()
 
-# Get the MongoDB URI from the environment variable
-mongo_uri = os.getenv('MONGO_URI')
-
-# MongoDB setup
-client = MongoClient(mongo_uri)
+# MongoDB setup: share the process-wide client from app/database.py
+from app.database import get_client
+client = get_client()
 db = client.chessclub
 users_collection = db.users
 
@@ -10,11 +10,33 @@ def create_app():
     app = Flask(__name__)
 
     # Allow requests from specific origins
-    CORS(app, origins="*")
+    CORS(app, origins="*", expose_headers=['X-Next-Cursor'])
+
+    from app.config import config
+    if config.METRICS_ENABLED:
+        from app.utils.metrics import init_metrics, register_mongo_listener
+        register_mongo_listener()
+        init_metrics(app)
+
+    if config.SLOW_QUERY_MONITOR:
+        from app.utils.query_monitor import register_query_monitor
+        register_query_monitor()
 
     from app.database import init_db
     init_db(app)
 
+    if config.ENSURE_INDEXES:
+        from app.database import db
+        from app.indexes import init_indexes
+        init_indexes(app, db)
+
+    if config.EMAIL_WORKER_ENABLED:
+        from app.utils.outbox import ensure_worker
+        ensure_worker()
+
+    from app.commands import register_commands
+    register_commands(app)
+
     # Register Blueprints
     from app.routes.main import main_bp
     from app.routes.images import images_bp
@@ -25,6 +47,9 @@ def create_app():
     from app.routes.tournaments import tournaments_bp
     from app.routes.users import users_bp
     from app.routes.upcomingActivities import upcomming_bp
+    from app.routes.leaderboard import leaderboard_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.slow_queries import slow_queries_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(images_bp)
@@ -35,5 +60,10 @@ def create_app():
     app.register_blueprint(tournaments_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(upcomming_bp)
+    app.register_blueprint(leaderboard_bp)
+    if config.METRICS_ENABLED:
+        app.register_blueprint(metrics_bp)
+    if config.SLOW_QUERY_MONITOR:
+        app.register_blueprint(slow_queries_bp)
 
     return app
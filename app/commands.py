@@ -0,0 +1,106 @@
+import click
+
+
+def register_commands(app):
+    @app.cli.command('ensure-indexes')
+    @click.option('--force', is_flag=True, help='Reconcile even if the stored index version is current.')
+    def ensure_indexes_command(force):
+        """Reconcile the index registry and report queries that still scan."""
+        from app.database import db
+        from app.indexes import INDEX_VERSION, ensure_indexes
+
+        report = ensure_indexes(db, force=force)
+        for problem in report['problems']:
+            click.echo(f"PROBLEM  {problem}")
+        if report['skipped']:
+            if report['version'] >= INDEX_VERSION:
+                click.echo(f"Indexes already at version {report['version']}")
+            else:
+                click.echo("Reconciliation is running elsewhere or waiting to retry; rerun with --force")
+            return
+        for scan in report['collection_scans']:
+            click.echo(f"COLLSCAN {scan['collection']} ({scan['index']}): {scan['filter']}")
+        click.echo(f"Indexes reconciled to version {report['version']}")
+
+    @app.cli.command('backfill-image-variants')
+    @click.option('--limit', type=int, default=None, help='Process at most this many originals.')
+    def backfill_image_variants_command(limit):
+        """Generate thumbnails and WebP variants for existing GridFS images."""
+        from app.database import db, fs
+        from app.utils.image_variants import backfill_variants
+
+        processed = 0
+        for file_id, generated in backfill_variants(db, fs, limit=limit):
+            processed += 1
+            click.echo(f"{file_id}: {', '.join(generated) or 'skipped'}")
+        click.echo(f"Processed {processed} file(s)")
+
+    @app.cli.command('drain-outbox')
+    @click.option('--limit', type=int, default=None, help='Send at most this many messages.')
+    def drain_outbox_command(limit):
+        """Deliver every due message in the email outbox, then exit."""
+        from app.utils.outbox import deliver_pending
+
+        counts = deliver_pending(limit=limit)
+        click.echo(f"Sent {counts['sent']}, failed {counts['failed']}")
+
+    @app.cli.command('sync-payments')
+    @click.option('--full', is_flag=True, help='Re-read every Checkout Session instead of only new ones.')
+    def sync_payments_command(full):
+        """Mirror Stripe Checkout Sessions into the payments collection."""
+        from app.database import db
+        from app.utils.stripe_sync import sync_payments
+
+        stored = sync_payments(db, full=full)
+        click.echo(f"Stored {stored} payment(s)")
+
+    @app.cli.command('reconcile-scores')
+    @click.option('--email', default=None, help='Only repair this user.')
+    def reconcile_scores_command(email):
+        """Recompute every user's scores.<category> counters from puzzle_progress."""
+        from app.database import users_collection
+        from app.utils.puzzle_progress import progress_collection
+        from app.utils.scores import reconcile_scores
+
+        changed = reconcile_scores(users_collection, progress_collection(), {'email': email} if email else None)
+        click.echo(f"Repaired score counters of {changed} user(s)")
+
+    @app.cli.command('migrate-puzzle-progress')
+    @click.option('--batch-size', type=int, default=100, help='Users fetched per round trip.')
+    def migrate_puzzle_progress_command(batch_size):
+        """Move legacy users.PuzzleArena trees into the puzzle_progress collection.
+
+        Safe to run while the app is serving traffic; users touched by a
+        request before the tool reaches them are migrated on the spot.
+        """
+        from app.utils.puzzle_progress import migrate_all
+
+        users = titles = 0
+        for email, moved in migrate_all(batch_size=batch_size):
+            users += 1
+            titles += moved
+            click.echo(f"{email}: {moved} title(s)")
+        click.echo(f"Migrated {titles} title(s) for {users} user(s)")
+
+    @app.cli.command('migrate-admin-collections')
+    def migrate_admin_collections_command():
+        """Move sessions, upcoming activities and tournaments out of admin_db."""
+        from app.database import db
+        from app.utils.admin_migration import migrate_admin_collection
+
+        moved = migrate_admin_collection(db)
+        for collection, count in moved.items():
+            click.echo(f"{collection}: moved {count}")
+
+    @app.cli.command('backfill-starts-at')
+    @click.option('--recompute', is_flag=True, help='Parse every document again, not only those without starts_at.')
+    def backfill_starts_at_command(recompute):
+        """Parse the date/time strings of existing sessions, activities and tournaments."""
+        from app.database import db
+        from app.utils.schedule import backfill_starts_at
+
+        for name in ('sessions', 'upcoming_activities', 'tournaments'):
+            updated, unparseable = backfill_starts_at(db[name], recompute=recompute)
+            click.echo(f"{name}: set starts_at on {updated}")
+            for doc_id in unparseable:
+                click.echo(f"UNPARSEABLE {name} {doc_id}")
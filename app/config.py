@@ -1,8 +1,115 @@
 import os
 
 class Config:
-    MAX_RETRIES = 3
-    RETRY_DELAY_SECONDS = 1
+    # Outbound email delivery attempts; the delay doubles after each failure
+    MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
+    RETRY_DELAY_SECONDS = int(os.getenv('RETRY_DELAY_SECONDS', '1'))
     MONGO_URI = os.getenv('MONGO_URI')
+    MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'chessDb_dev')
+    # One client per process (see app/database.py). Serverless instances
+    # serve a request at a time, so a small pool whose idle sockets are
+    # closed quickly keeps the Atlas connection count down.
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '10'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    # Comma-separated wire compressors; zstd and snappy need their extras installed
+    MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zlib')
+
+    # Reconcile the index registry in app/indexes.py when the app starts
+    ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+
+    # In-process cache for the /imagesets and /get_level listings. The TTL
+    # bounds how stale another worker's copy can get; 0 disables expiry.
+    IMAGE_SET_CACHE_SIZE = int(os.getenv('IMAGE_SET_CACHE_SIZE', '64'))
+    IMAGE_SET_CACHE_TTL = int(os.getenv('IMAGE_SET_CACHE_TTL', '60'))
+
+    # Cache-Control max-age for GridFS images; a file id never changes content
+    IMAGE_MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', '86400'))
+
+    # SMTP account used for every outgoing email. Point SMTP_HOST/SMTP_PORT at
+    # a local sink with SMTP_STARTTLS=false and an empty password to test.
+    SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+    SMTP_TIMEOUT_SECONDS = int(os.getenv('SMTP_TIMEOUT_SECONDS', '30'))
+    SENDER_EMAIL = os.getenv('SENDER_EMAIL', 'connect@chesschamps.us')
+    SENDER_PASSWORD = os.getenv('SENDER_PASSWORD', 'iyln tkpp vlpo sjep')
+
+    # Send outbox messages during the request instead of waiting for the worker
+    EMAIL_SEND_INLINE = os.getenv('EMAIL_SEND_INLINE', 'true').lower() == 'true'
+    # Background thread draining the email_outbox collection. Off by default:
+    # serverless instances freeze between requests, so there retries come
+    # from the /outbox/drain cron; turn it on for long-running servers.
+    EMAIL_WORKER_ENABLED = os.getenv('EMAIL_WORKER_ENABLED', 'false').lower() == 'true'
+    EMAIL_WORKER_POLL_SECONDS = float(os.getenv('EMAIL_WORKER_POLL_SECONDS', '5'))
+    # How long a claimed message stays locked before another worker may retry it
+    EMAIL_SEND_LEASE_SECONDS = int(os.getenv('EMAIL_SEND_LEASE_SECONDS', '300'))
+    # Bearer token the /outbox/drain cron must send; the route is off without it.
+    # vercel.json retries once a day, which every plan allows; on Pro the
+    # schedule can be tightened to "*/5 * * * *" for quicker retries.
+    CRON_SECRET = os.getenv('CRON_SECRET')
+    # Messages sent per /outbox/drain call, to stay inside the function timeout
+    EMAIL_DRAIN_LIMIT = int(os.getenv('EMAIL_DRAIN_LIMIT', '50'))
+    # Close the pooled SMTP session after this long without traffic
+    SMTP_IDLE_SECONDS = int(os.getenv('SMTP_IDLE_SECONDS', '60'))
+
+    # /send-email/bulk: parallel SMTP sessions and recipients per batch
+    BROADCAST_POOL_SIZE = int(os.getenv('BROADCAST_POOL_SIZE', '4'))
+    BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '25'))
+    # Larger broadcasts are queued in the outbox instead of sent during the
+    # request, which would outrun the serverless function timeout
+    BROADCAST_INLINE_LIMIT = int(os.getenv('BROADCAST_INLINE_LIMIT', '50'))
+
+    # Stripe Checkout Sessions behind /check-email, mirrored into `payments`.
+    # STRIPE_API_BASE can point at a local stub of the Stripe API.
+    STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+    STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+    STRIPE_TIMEOUT_SECONDS = int(os.getenv('STRIPE_TIMEOUT_SECONDS', '10'))
+    PAYMENT_LINK = os.getenv('PAYMENT_LINK')
+    # Minimum time between syncs triggered by a /check-email miss
+    PAYMENT_SYNC_MIN_INTERVAL = int(os.getenv('PAYMENT_SYNC_MIN_INTERVAL', '60'))
+
+    # Signing secret of the /stripe/webhook endpoint (whsec_...)
+    STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+    STRIPE_WEBHOOK_TOLERANCE = int(os.getenv('STRIPE_WEBHOOK_TOLERANCE', '300'))
+
+    # Documents fetched per round trip when streaming NDJSON exports
+    NDJSON_BATCH_SIZE = int(os.getenv('NDJSON_BATCH_SIZE', '200'))
+
+    # How numeric dates such as 10/05/2026 from the admin UI are read: MDY
+    # (month first) or DMY (day first). Any other value rejects dates that
+    # read differently both ways. ISO dates (2026-10-05) are always accepted.
+    DATE_ORDER = os.getenv('DATE_ORDER', 'MDY').upper()
+    # IANA zone the admin UI's dates and times are entered in. starts_at is
+    # stored as UTC; after changing this run `flask backfill-starts-at --recompute`
+    CLUB_TIMEZONE = os.getenv('CLUB_TIMEZONE', 'UTC')
+
+    # Short-lived cache for /leaderboard and /leaderboard/rank
+    LEADERBOARD_CACHE_TTL = int(os.getenv('LEADERBOARD_CACHE_TTL', '5'))
+    LEADERBOARD_CACHE_SIZE = int(os.getenv('LEADERBOARD_CACHE_SIZE', '2048'))
+
+    # Per-puzzle solve statistics; cached totals are updated in place as
+    # attempts land and fully recomputed after the TTL
+    PUZZLE_STATS_CACHE_TTL = int(os.getenv('PUZZLE_STATS_CACHE_TTL', '300'))
+    PUZZLE_STATS_CACHE_SIZE = int(os.getenv('PUZZLE_STATS_CACHE_SIZE', '256'))
+
+    # Prometheus text metrics at /metrics. Reply/command byte counts re-encode
+    # every BSON document, so they are off unless asked for while profiling.
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token for /metrics and /slow-queries; both answer 401 without it
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    METRICS_MONGO_BYTES = os.getenv('METRICS_MONGO_BYTES', 'false').lower() == 'true'
+
+    # Explain slow finds/updates in the background and report collection
+    # scans with the endpoint that issued them (meant for staging)
+    SLOW_QUERY_MONITOR = os.getenv('SLOW_QUERY_MONITOR', 'false').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+    SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', '1.0'))
+    # Re-explain a query shape at most this often
+    SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+    # Query shapes kept for /slow-queries; the least recently seen go first
+    SLOW_QUERY_MAX_SHAPES = int(os.getenv('SLOW_QUERY_MAX_SHAPES', '500'))
 
 config = Config()
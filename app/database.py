@@ -1,18 +1,113 @@
-from pymongo import MongoClient
-from gridfs import GridFS
 import os
+import threading
+from pymongo import MongoClient
+from app.config import config
 
 client = None
 db = None
 fs = None
 admin_collection = None
 users_collection = None
+sessions_collection = None
+upcoming_activities_collection = None
+tournaments_collection = None
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_event_listeners = []
+
+class ProcessLocal:
+    """A client, database or collection handle that follows the current process.
+
+    Route modules bind these at import. Each process, a forked worker
+    included, resolves them against its own client from get_client() the
+    first time it uses them, so no socket is ever shared across fork().
+    """
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._target = None
+        self._pid = None
+
+    def resolve(self):
+        pid = os.getpid()
+        if self._target is None or self._pid != pid:
+            self._target = self._resolve(get_client())
+            self._pid = pid
+        return self._target
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            # Not forwarded, so copy/pickle probes don't resolve a client
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, name):
+        return self.resolve()[name]
+
+class LazyGridFS:
+    """GridFS bucket that is built on first use, so start-up never imports gridfs.
+
+    Rebuilt per process, like the ProcessLocal database it sits on.
+    """
+
+    def __init__(self, database):
+        self._database = database
+        self._fs = None
+        self._pid = None
+
+    def __getattr__(self, name):
+        if self._fs is None or self._pid != os.getpid():
+            from gridfs import GridFS
+            self._fs = GridFS(self._database.resolve())
+            self._pid = os.getpid()
+        return getattr(self._fs, name)
+
+def add_event_listener(listener):
+    """Register a pymongo monitoring listener for the shared client.
+
+    Listeners are fixed when the client is built, so register them before
+    init_db / get_client is first called.
+    """
+    _event_listeners.append(listener)
+
+def get_client():
+    """This process's MongoClient, built on first use.
+
+    Warm invocations of the same process reuse it and its pool. A client
+    inherited through fork() shares sockets with the parent, so a child
+    process builds its own; the ProcessLocal handles from init_db follow.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                compressors = [name.strip() for name in config.MONGO_COMPRESSORS.split(',') if name.strip()]
+                _client = MongoClient(
+                    config.MONGO_URI,
+                    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+                    connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    compressors=compressors or None,
+                    event_listeners=list(_event_listeners),
+                    # Don't block start-up on discovery; the first operation connects
+                    connect=False,
+                )
+                _client_pid = pid
+    return _client
 
 def init_db(app):
     global client, db, fs, admin_collection, users_collection
-    mongo_uri = os.getenv('MONGO_URI')
-    client = MongoClient(mongo_uri)
-    db = client.chessDb_dev
-    admin_collection = db.admin_db
-    users_collection = db.users
-    fs = GridFS(db)
+    global sessions_collection, upcoming_activities_collection, tournaments_collection
+    client = ProcessLocal(lambda mongo: mongo)
+    db = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME])
+    admin_collection = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME].admin_db)
+    users_collection = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME].users)
+    sessions_collection = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME].sessions)
+    upcoming_activities_collection = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME].upcoming_activities)
+    tournaments_collection = ProcessLocal(lambda mongo: mongo[config.MONGO_DB_NAME].tournaments)
+    fs = LazyGridFS(db)
@@ -0,0 +1,317 @@
+import logging
+import time
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Bump INDEX_VERSION whenever INDEXES changes so that the next start-up
+# reconciles the database again. The applied version is stored in the
+# `meta` collection, which keeps warm starts down to a single find_one.
+INDEX_VERSION = 10
+
+# A start-up claims the reconciliation for this long. Concurrent cold starts
+# after a version bump leave it to the claimant, and after a failure (say a
+# unique index over duplicate data) the next attempt waits for the lease.
+INDEX_LEASE_SECONDS = 600
+
+# collection -> list of index declarations. `probe` is a representative
+# query shape from the routes; it is explained after reconciling to check
+# that the planner actually picks an index for it.
+INDEXES = {
+    'users': [
+        {
+            'name': 'email_unique',
+            'keys': [('email', ASCENDING)],
+            'unique': True,
+            'probe': {'filter': {'email': ''}},
+        },
+        {
+            'name': 'name',
+            'keys': [('name', ASCENDING)],
+            'probe': {'filter': {'name': ''}},
+        },
+        {
+            # /studentList?level=... pages through a level in _id order
+            'name': 'level_id',
+            'keys': [('level', ASCENDING), ('_id', ASCENDING)],
+            'probe': {'filter': {'level': ''}, 'sort': [('_id', ASCENDING)]},
+        },
+        {
+            # Leaderboard: top K per level and rank counts
+            'name': 'level_puzzle_score',
+            'keys': [('level', ASCENDING), ('puzzle_score', DESCENDING), ('_id', ASCENDING)],
+            'probe': {'filter': {'level': ''}, 'sort': [('puzzle_score', DESCENDING), ('_id', ASCENDING)]},
+        },
+    ],
+    'image_sets': [
+        {
+            'name': 'level_category_title',
+            'keys': [('level', ASCENDING), ('category', ASCENDING), ('title', ASCENDING)],
+            'probe': {'filter': {'title': '', 'level': '', 'category': '', 'live': ''}},
+        },
+        {
+            'name': 'level_id',
+            'keys': [('level', ASCENDING), ('_id', DESCENDING)],
+            'probe': {'filter': {'level': ''}, 'sort': [('_id', DESCENDING)]},
+        },
+    ],
+    'fs.files': [
+        {
+            # Content hash of deduplicated uploads; files stored before
+            # deduplication have no hash and stay out of the index
+            'name': 'sha256_unique',
+            'keys': [('sha256', ASCENDING)],
+            'unique': True,
+            'partialFilterExpression': {'sha256': {'$exists': True}},
+            'probe': {'filter': {'sha256': ''}},
+        },
+    ],
+    'email_outbox': [
+        {
+            'name': 'status_next_attempt',
+            'keys': [('status', ASCENDING), ('next_attempt_at', ASCENDING)],
+            'probe': {'filter': {'status': {'$in': ['pending', 'sending']}, 'next_attempt_at': {'$lte': 0}}},
+        },
+        {
+            # Delivered messages are kept for a week for troubleshooting
+            'name': 'sent_at_ttl',
+            'keys': [('sent_at', ASCENDING)],
+            'expireAfterSeconds': 7 * 24 * 3600,
+        },
+    ],
+    'payments': [
+        {
+            'name': 'email',
+            'keys': [('email', ASCENDING)],
+            'probe': {'filter': {'email': ''}},
+        },
+    ],
+    'puzzle_progress': [
+        {
+            # One progress document per user and puzzle title
+            'name': 'email_category_title_unique',
+            'keys': [('email', ASCENDING), ('category', ASCENDING), ('title', ASCENDING)],
+            'unique': True,
+            'probe': {'filter': {'email': '', 'category': '', 'title': ''}},
+        },
+        {
+            # /puzzle_stats aggregates one title, optionally within a level
+            'name': 'category_title_level',
+            'keys': [('category', ASCENDING), ('title', ASCENDING), ('level', ASCENDING)],
+            'probe': {'filter': {'category': '', 'title': '', 'level': ''}},
+        },
+    ],
+    'sessions': [
+        {
+            # ?from=&to= windows, listing order, /del-sessions and bulk email lookups
+            'name': 'starts_at',
+            'keys': [('starts_at', ASCENDING)],
+            'probe': {'filter': {'starts_at': {'$gte': 0}}, 'sort': [('starts_at', ASCENDING)]},
+        },
+    ],
+    'upcoming_activities': [
+        {
+            'name': 'starts_at_title',
+            'keys': [('starts_at', ASCENDING), ('title', ASCENDING)],
+            'probe': {'filter': {'starts_at': {'$gte': 0}}, 'sort': [('starts_at', ASCENDING)]},
+        },
+    ],
+    'tournaments': [
+        {
+            'name': 'starts_at',
+            'keys': [('starts_at', ASCENDING)],
+            'probe': {'filter': {'starts_at': {'$gte': 0}}, 'sort': [('starts_at', ASCENDING)]},
+        },
+        {
+            # /update-tournament matches on type
+            'name': 'type',
+            'keys': [('type', ASCENDING)],
+            'probe': {'filter': {'type': ''}},
+        },
+    ],
+    'stripe_events': [
+        {
+            # Stripe retries for three days; keep processed ids well past that
+            'name': 'received_at_ttl',
+            'keys': [('received_at', ASCENDING)],
+            'expireAfterSeconds': 30 * 24 * 3600,
+        },
+    ],
+}
+
+
+INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+
+def _index_options(spec):
+    options = {'name': spec['name']}
+    for option in INDEX_OPTIONS:
+        if option in spec:
+            options[option] = spec[option]
+    return options
+
+
+def _normalize_keys(keys):
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in keys]
+
+
+def _same_options(existing, spec):
+    for option in INDEX_OPTIONS:
+        if option in ('unique', 'sparse'):
+            if bool(existing.get(option, False)) != bool(spec.get(option, False)):
+                return False
+        elif existing.get(option) != spec.get(option):
+            return False
+    return True
+
+
+def _restore(collection, name, existing):
+    # Put back an index that was dropped to make way for one that failed
+    # to build, so its queries keep using it
+    options = {option: existing[option] for option in INDEX_OPTIONS if option in existing}
+    try:
+        collection.create_index(list(existing['key']), name=name, **options)
+    except OperationFailure as e:
+        logger.warning(f"Could not restore index {collection.name}.{name}: {e}")
+
+
+def reconcile_collection(collection, specs):
+    """Create missing indexes and rebuild the ones whose definition changed.
+
+    Existing indexes are matched by key pattern as well as by name, so an
+    auto-named index such as `email_1` over the same keys and options
+    counts as in place instead of conflicting with the declared name.
+    Returns a list of problems, empty when everything is in place.
+    """
+    problems = []
+    existing = collection.index_information()
+    for spec in specs:
+        keys = _normalize_keys(spec['keys'])
+        same_keys = {name: info for name, info in existing.items()
+                     if name != '_id_' and _normalize_keys(info['key']) == keys}
+        if any(_same_options(info, spec) for info in same_keys.values()):
+            continue
+        # MongoDB allows one index per key pattern, and the name is taken
+        # by whatever holds it now
+        stale = dict(same_keys)
+        if spec['name'] in existing:
+            stale[spec['name']] = existing[spec['name']]
+        try:
+            for name in stale:
+                try:
+                    collection.drop_index(name)
+                except OperationFailure as e:
+                    # IndexNotFound: already dropped by someone else
+                    if e.code != 27:
+                        raise
+            collection.create_index(spec['keys'], **_index_options(spec))
+        except OperationFailure as e:
+            # Most likely a unique index over data that already has duplicates
+            problems.append(f"{collection.name}.{spec['name']}: {e}")
+            for name, info in stale.items():
+                _restore(collection, name, info)
+    return problems
+
+
+def plan_has_collscan(plan):
+    """Walk an explain() plan tree and report whether any stage is a COLLSCAN."""
+    if isinstance(plan, dict):
+        if plan.get('stage') == 'COLLSCAN':
+            return True
+        return any(plan_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(plan_has_collscan(value) for value in plan)
+    return False
+
+
+def explain_probes(db, indexes=None):
+    """Explain every probe query and return the ones that still scan the collection."""
+    scans = []
+    for collection_name, specs in (indexes or INDEXES).items():
+        collection = db[collection_name]
+        for spec in specs:
+            probe = spec.get('probe')
+            if not probe:
+                continue
+            cursor = collection.find(probe['filter'])
+            if probe.get('sort'):
+                cursor = cursor.sort(probe['sort'])
+            plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+            if plan_has_collscan(plan):
+                scans.append({'collection': collection_name, 'index': spec['name'], 'filter': probe['filter']})
+    return scans
+
+
+def ensure_indexes(db, force=False):
+    """Bring the database up to INDEX_VERSION.
+
+    Returns a report dict with the applied version, any index that could not
+    be built and any probe query that still does a collection scan. The
+    version is recorded only when every index is in place; `force` ignores
+    both the version and the lease.
+    """
+    report = {'version': INDEX_VERSION, 'skipped': False, 'problems': [], 'collection_scans': []}
+
+    if not force and not _claim(db):
+        state = db.meta.find_one({'_id': 'indexes'}) or {}
+        report['skipped'] = True
+        report['version'] = state.get('version', 0)
+        report['problems'] = state.get('problems', [])
+        return report
+
+    for collection_name, specs in INDEXES.items():
+        report['problems'].extend(reconcile_collection(db[collection_name], specs))
+
+    report['collection_scans'] = explain_probes(db)
+
+    if report['problems']:
+        # Keep the lease so the retry waits INDEX_LEASE_SECONDS instead of
+        # rebuilding on every cold start
+        db.meta.update_one({'_id': 'indexes'}, {'$set': {'problems': report['problems']}}, upsert=True)
+    else:
+        db.meta.update_one(
+            {'_id': 'indexes'},
+            {'$set': {'version': INDEX_VERSION}, '$unset': {'claimed_at': '', 'problems': ''}},
+            upsert=True
+        )
+
+    return report
+
+
+def _claim(db):
+    """Atomically take the reconciliation lease unless the version is current.
+
+    Returns True when this process should reconcile.
+    """
+    now = time.time()
+    try:
+        result = db.meta.update_one(
+            {'_id': 'indexes', 'version': {'$not': {'$gte': INDEX_VERSION}}, '$or': [
+                {'claimed_at': {'$exists': False}},
+                {'claimed_at': {'$lt': now - INDEX_LEASE_SECONDS}},
+            ]},
+            {'$set': {'claimed_at': now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The state document exists: the version is current or the lease is held
+        return False
+    return bool(result.modified_count or result.upserted_id)
+
+
+def init_indexes(app, db):
+    try:
+        report = ensure_indexes(db)
+    except PyMongoError as e:
+        app.logger.warning(f"Index reconciliation failed: {e}")
+        return
+
+    for problem in report['problems']:
+        app.logger.warning(f"Index problem: {problem}")
+    if report['skipped']:
+        return
+    for scan in report['collection_scans']:
+        app.logger.warning(f"Query on {scan['collection']} still scans the collection: {scan['filter']}")
+    app.logger.info(f"Indexes reconciled to version {report['version']}")
@@ -1,16 +1,23 @@
 from bson import ObjectId
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-import requests
-from app.database import admin_collection,users_collection
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
-from flask import Blueprint, request, jsonify
-import os
+from pymongo.errors import DuplicateKeyError
+from app.config import config
+from app.database import db, admin_collection,users_collection
+from app.utils.email_utils import course_registration_email
+from app.utils.outbox import send_through_outbox
+from app.utils.stripe_sync import StripeSyncError, payment_from_session, sync_if_stale, upsert_payment, verify_signature
+
+# Accounts that always have access, regardless of Stripe
+ALWAYS_PAID_EMAILS = {"nsriramya7@gmail.com", "sumit.compliance@gmail.com"}
+
+# registered_courses.payment_status once Stripe confirms the payment
+PAID_STATUS = "Paid"
+PAYMENT_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+# Checkout Session payment_status values that grant access; 'unpaid'
+# sessions are mirrored into payments too but do not count
+PAID_CHECKOUT_STATUSES = ['paid', 'no_payment_required']
 
-stripe_url = "https://api.stripe.com/v1/checkout/sessions"
-secret_key = os.getenv('STRIPE_SECRET_KEY')
-payment_link = os.getenv('PAYMENT_LINK')
 courses_bp = Blueprint('courses', __name__)
 
 @courses_bp.route('/add-course', methods=['POST'])
@@ -180,89 +187,91 @@ def send_email():
         return jsonify({"error": "Email and Title are required"}), 400
 
     try:
-        # Email configuration
-        sender_email = "connect@chesschamps.us"
-        sender_password = "iyln tkpp vlpo sjep"  # Use your app-specific password here
-        subject = "Course Registration - Action Required"
-
-        body = f"""
-        Dear Participant,
-
-        Thank you for registering for the course: "{title}".
-
-        To complete your registration, please make a payment of $10 using the following link:
-
-        https://buy.stripe.com/3cs4jw8xYePG6Qg9AA
-
-        After making the payment, please note down the transaction ID as it will be important for confirming your registration.
+        # Sent now over a pooled SMTP session; the outbox retries it on failure
+        subject, body = course_registration_email(title)
+        message_id, sent = send_through_outbox(email, subject, body, kind='course_registration')
 
-        If you have any questions or need further assistance, feel free to contact us.
-
-        Best regards,
-        The Course Team
-        """
-
-        # Create the email
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Connect to the Gmail server and send the email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, email, text)
-        server.quit()
-
-        return jsonify({"message": "Email sent successfully"}), 200
+        if sent:
+            return jsonify({"message": "Email sent successfully", "id": str(message_id)}), 200
+        return jsonify({"message": "Email queued for delivery", "id": str(message_id)}), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @courses_bp.route('/check-email', methods=['GET'])
 def check_email():
-    # Retrieve the email and payment link from the query parameters
-    email_to_check = request.args.get('email')
-    email_to_check = email_to_check.strip()
+    # Retrieve the email from the query parameters
+    email_to_check = (request.args.get('email') or '').strip().lower()
 
     if not email_to_check:
         return jsonify({'error': "'email' query parameter is required"}), 400
 
-    if not payment_link:
-        return jsonify({'error': "'payment_link' query parameter is required"}), 400
-
-    # Make the API call
-    response = requests.get(
-        stripe_url,
-        params={
-            "payment_link": payment_link,
-            "expand[]": "data.customer",
-            "limit": 100
-        },
-        auth=(secret_key, '')
-    )
+    if email_to_check in ALWAYS_PAID_EMAILS or _has_payment(email_to_check):
+        return jsonify({'success': True}), 200
 
-    if response.status_code != 200:
-        return jsonify({'error': 'Failed to retrieve data from Stripe'}), response.status_code
+    # A payment made since the last sync is not mirrored yet; pull anything
+    # new from Stripe (at most once per PAYMENT_SYNC_MIN_INTERVAL) and retry
+    try:
+        if sync_if_stale(db) and _has_payment(email_to_check):
+            return jsonify({'success': True}), 200
+    except (StripeSyncError, OSError) as e:
+        print(f"Stripe sync failed: {e}")
+        return jsonify({'error': 'Failed to retrieve data from Stripe'}), 502
 
-    data = response.json()
+    return jsonify({'success': False}), 200
 
-    # Extract email addresses from the response
-    emails = []
-    emails.append("nsriramya7@gmail.com")
-    emails.append("sumit.compliance@gmail.com")
-    for session in data.get('data', []):
-        customer = session.get('customer_details')
-        if customer and isinstance(customer, dict):
-            email = customer.get('email')
-            if email:
-                emails.append(email)
+def _has_payment(email):
+    return db.payments.find_one(
+        {'email': email, 'payment_status': {'$in': PAID_CHECKOUT_STATUSES}}, {'_id': 1}
+    ) is not None
 
-    # Check if the provided email is in the list
-    if email_to_check in emails:
-        return jsonify({'success': True}), 200
-    else:
-        return jsonify({'success': False}), 200
 
+@courses_bp.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    payload = request.get_data()
+    if not verify_signature(payload, request.headers.get('Stripe-Signature'),
+                            config.STRIPE_WEBHOOK_SECRET, config.STRIPE_WEBHOOK_TOLERANCE):
+        return jsonify({'error': 'Invalid signature'}), 400
+
+    event = request.get_json(force=True, silent=True) or {}
+    event_id = event.get('id')
+    if not event_id:
+        return jsonify({'error': 'Event id is required'}), 400
+
+    # Stripe delivers at least once; the event id is the idempotency key
+    try:
+        db.stripe_events.insert_one({'_id': event_id, 'type': event.get('type'), 'received_at': datetime.utcnow()})
+    except DuplicateKeyError:
+        return jsonify({'received': True, 'duplicate': True}), 200
+
+    try:
+        if event.get('type') in PAYMENT_EVENTS:
+            _record_checkout_payment(event['data']['object'])
+    except Exception as e:
+        # Forget the event so Stripe's retry processes it again
+        db.stripe_events.delete_one({'_id': event_id})
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({'received': True}), 200
+
+def _record_checkout_payment(session):
+    payment = payment_from_session(session)
+    if payment is None:
+        return
+    upsert_payment(db, payment)
+    if session.get('payment_status') != 'paid':
+        return
+
+    # Only a course named in the session metadata is settled. Without one
+    # (or when it matches no registration) the payment stays in `payments`
+    # flagged for manual matching rather than settling a guessed course.
+    # payments keys on the lower-cased email, as /check-email looks it up;
+    # users are matched on that and on the address as Stripe sent it.
+    emails = list({payment['email'], session['customer_details']['email'].strip()})
+    title = (session.get('metadata') or {}).get('course_title')
+    matched = 0
+    if title:
+        matched = users_collection.update_one(
+            {'email': {'$in': emails}, 'registered_courses.title': title},
+            {'$set': {'registered_courses.$.payment_status': PAID_STATUS}}
+        ).matched_count
+    db.payments.update_one({'_id': payment['_id']}, {'$set': {'needs_course_match': not matched}})
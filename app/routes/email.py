@@ -1,8 +1,11 @@
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-from app.utils.email_utils import send_email
+from app.config import config
+from app.utils.auth import bearer_matches
+from app.database import db, sessions_collection, users_collection
+from app.utils.email_utils import send_bulk, session_enrollment_email
+from app.utils.outbox import deliver_pending, enqueue_many, send_through_outbox
+from app.utils.schedule import start_queries
 
 email_bp = Blueprint('email', __name__)
 
@@ -19,41 +22,117 @@ def send_email():
         return jsonify({"error": "Email, session link, date, time, and coach name are required"}), 400
 
     try:
-        # Email configuration
-        sender_email = "connect@chesschamps.us"
-        sender_password = "iyln tkpp vlpo sjep"  # Use your app-specific password here
-        subject = "Your Chess Session Enrollment"
-
-        body = (
-            f"Dear Participant,\n\n"
-            f"You have successfully enrolled in the chess session.\n\n"
-            f"Details of the session are as follows:\n"
-            f"Date: {date}\n"
-            f"Time: {time}\n"
-            f"Coach: {coach_name}\n"
-            f"Session Link: {session_link}\n\n"
-            f"We hope you enjoy your session!\n\n"
-            f"Best regards,\n"
-            f"The Chess Training Team"
-        )
-
-        # Create the email
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Connect to the Gmail server and send the email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, email, text)
-        server.quit()
-
-        return jsonify({"message": "Email sent successfully"}), 200
+        # Sent now over a pooled SMTP session; the outbox retries it on failure
+        subject, body = session_enrollment_email(session_link, date, time, coach_name)
+        message_id, sent = send_through_outbox(email, subject, body, kind='session_enrollment')
+
+        if sent:
+            return jsonify({"message": "Email sent successfully", "id": str(message_id)}), 200
+        return jsonify({"message": "Email queued for delivery", "id": str(message_id)}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@email_bp.route('/outbox/drain', methods=['GET'])
+def drain_outbox():
+    """Retry due outbox messages; called by the Vercel cron in vercel.json.
+
+    Vercel sends 'Authorization: Bearer <CRON_SECRET>'. Without
+    CRON_SECRET configured the route stays closed.
+    """
+    if not bearer_matches(config.CRON_SECRET):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        counts = deliver_pending(limit=config.EMAIL_DRAIN_LIMIT)
+        return jsonify(counts), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@email_bp.route('/send-email/bulk', methods=['POST'])
+def send_bulk_email():
+    """Announce one session to many students in a single request.
+
+    The session is either given inline ('session' with date, time,
+    coach_name and session_link) or looked up by 'date' and 'time' among
+    the sessions stored by /add-session. Recipients are every user of
+    'level', or the registered users among an explicit 'emails' list.
+    Up to BROADCAST_INLINE_LIMIT recipients are mailed during the request
+    (200 with per-recipient results); larger broadcasts are queued in the
+    outbox (202).
+    """
+    data = request.json or {}
+    session_fields = ['date', 'time', 'coach_name', 'session_link']
+
+    session = data.get('session')
+    if session is None:
+        if not data.get('date') or not data.get('time'):
+            return jsonify({"error": "Either session or date and time are required"}), 400
+        session = None
+        for query in start_queries(data['date'], data['time']):
+            session = sessions_collection.find_one(query, {'_id': 0})
+            if session:
+                break
+        if not session:
+            return jsonify({"error": "Session not found"}), 404
+
+    missing = [field for field in session_fields if not session.get(field)]
+    if missing:
+        return jsonify({"error": f"Session is missing {', '.join(missing)}"}), 400
+
+    level = data.get('level')
+    emails = data.get('emails')
+    if emails is not None and not (isinstance(emails, list) and all(isinstance(email, str) for email in emails)):
+        return jsonify({"error": "emails must be a list of email addresses"}), 400
+    if emails:
+        # Only registered users can be mailed, so this is not an open relay
+        registered = {user['email'] for user in users_collection.find({'email': {'$in': emails}}, {'_id': 0, 'email': 1})}
+        recipients = [email for email in emails if email in registered]
+    elif level:
+        recipients = [user['email'] for user in users_collection.find({'level': level}, {'_id': 0, 'email': 1}) if user.get('email')]
+    else:
+        return jsonify({"error": "Either level or emails is required"}), 400
+
+    # Keep the first occurrence of each address so nobody is mailed twice
+    recipients = list(dict.fromkeys(recipients))
+    if not recipients:
+        return jsonify({"error": "No recipients found"}), 404
+
+    try:
+        subject, body = session_enrollment_email(session['session_link'], session['date'], session['time'], session['coach_name'])
+        if len(recipients) > config.BROADCAST_INLINE_LIMIT:
+            # Too many to send before the function times out: the outbox
+            # delivers them (worker, /outbox/drain or flask drain-outbox)
+            queued = enqueue_many(recipients, subject, body, kind='session_enrollment')
+            report = {
+                'session': {field: session[field] for field in session_fields},
+                'level': level,
+                'total': len(recipients),
+                'queued': queued,
+                'created_at': datetime.utcnow(),
+            }
+            report['id'] = str(db.email_broadcasts.insert_one(dict(report)).inserted_id)
+            report['created_at'] = report['created_at'].isoformat()
+            return jsonify(report), 202
+
+        results, elapsed = send_bulk(recipients, subject, body)
+
+        sent = sum(1 for result in results if result['status'] == 'sent')
+        report = {
+            'session': {field: session[field] for field in session_fields},
+            'level': level,
+            'total': len(results),
+            'sent': sent,
+            'failed': len(results) - sent,
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(sent / elapsed, 2) if elapsed else 0.0,
+            'created_at': datetime.utcnow(),
+        }
+        report['id'] = str(db.email_broadcasts.insert_one({**report, 'results': results}).inserted_id)
+        report['created_at'] = report['created_at'].isoformat()
+        report['results'] = results
+
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
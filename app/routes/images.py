@@ -1,11 +1,24 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from app.database import db, fs
 from bson import ObjectId
-from io import BytesIO
+from bson.errors import InvalidId
 from pymongo import errors
+from app.config import config
+from app.utils.cache import LRUCache
+from app.utils.gridfs_utils import put_deduplicated, release_blob, release_blobs, send_grid_out
+from app.utils.image_variants import VARIANTS, generate_variants
+from app.utils.streaming import ndjson_response, wants_ndjson
 
 images_bp = Blueprint('images', __name__)
 
+# Listings served by /imagesets (ALL_LEVELS) and /get_level (keyed by level).
+# Every endpoint that writes image_sets must call invalidate_image_sets.
+ALL_LEVELS = '__all__'
+image_set_cache = LRUCache(maxsize=config.IMAGE_SET_CACHE_SIZE, ttl=config.IMAGE_SET_CACHE_TTL or None)
+
+def invalidate_image_sets(level):
+    image_set_cache.invalidate(level, ALL_LEVELS)
+
  
 @images_bp.route('/upload', methods=['POST'])
 def upload_image():
@@ -28,10 +41,16 @@ def upload_image():
         return jsonify({'error': 'No files uploaded'}), 400
 
     file_ids_dict = {}
+    replaced_ids = []
     try:
         for i, file in enumerate(files):
-            file_id = fs.put(file, filename=file.filename, content_type=file.content_type)
+            # Identical content already in GridFS is reused instead of stored again
+            file_id, reused = put_deduplicated(db, fs, file)
+            if not reused:
+                _generate_variants(file_id)
             puzzle_key = f'puzzle{puzzle_number}'  # Use puzzle_number to create the key
+            if puzzle_key in file_ids_dict:
+                release_blob(db, ObjectId(file_ids_dict[puzzle_key]['id']))
             file_ids_dict[puzzle_key] = {
                 'id': str(file_id),
                 'move': "Black to Move",
@@ -39,6 +58,7 @@ def upload_image():
                 'sid_link': None  # Placeholder, update as needed
             }
     except Exception as e:
+        _release_blobs(puzzle['id'] for puzzle in file_ids_dict.values())
         return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
 
     try:
@@ -55,6 +75,7 @@ def upload_image():
             print("Existing image set found, updating...")
             print(f"Existing file_ids: {existing_image_set.get('file_ids', {})}")
             updated_file_ids = existing_image_set.get('file_ids', {})
+            replaced_ids = [updated_file_ids[key]['id'] for key in file_ids_dict if key in updated_file_ids]
             updated_file_ids.update(file_ids_dict)
             print(f"Updated file_ids: {updated_file_ids}")
             
@@ -75,10 +96,29 @@ def upload_image():
                 'file_ids': file_ids_dict
             })
     except Exception as e:
+        _release_blobs(puzzle['id'] for puzzle in file_ids_dict.values())
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
+    # The slots that were overwritten no longer reference their old blobs
+    _release_blobs(replaced_ids)
+
+    invalidate_image_sets(level)
     return jsonify({'message': 'Images uploaded successfully', 'file_ids': file_ids_dict}), 200
 
+def _generate_variants(file_id):
+    # Derivatives are an optimisation; a failure here must not fail the upload
+    try:
+        generate_variants(db, fs, file_id)
+    except Exception as e:
+        print(f"Failed to generate variants for {file_id}: {e}")
+
+def _release_blobs(file_ids):
+    file_ids = [ObjectId(file_id) for file_id in file_ids]
+    try:
+        release_blobs(db, file_ids)
+    except errors.PyMongoError as e:
+        print(f"Failed to release blobs {file_ids}: {e}")
+
 @images_bp.route('/updatelivepuzzle', methods=['POST'])
 def update_live_puzzle():
     # Extract parameters from the request
@@ -117,6 +157,8 @@ def update_live_puzzle():
     try:
         # Update the document in the database
         result = db.image_sets.update_one(query, update_operation)
+        if result.modified_count:
+            invalidate_image_sets(level)
 
         # Handle the result of the update operation
         if result.matched_count == 0:
@@ -219,6 +261,8 @@ def update_puzzle_sol():
             },
             update_query
         )
+        if result.modified_count:
+            invalidate_image_sets(level)
         
         if result.matched_count == 0:
             return jsonify({'error': 'No matching document found'}), 404
@@ -237,18 +281,26 @@ def get_images_by_title():
     category = request.args.get('category')
     try:
         # Find the image set by both title and level
-        image_set = db.image_sets.find_one({'title': title, 'level': level,'category': category})
+        image_set = db.image_sets.find_one({'title': title, 'level': level,'category': category}, {'file_ids': 1})
         if not image_set:
             return jsonify({'error': 'No images found with the given title and level'}), 404
-        print(image_set)
+
+        # One batched fs.files query for every puzzle instead of an fs.get per file
+        puzzles = image_set['file_ids']
+        file_ids = [ObjectId(puzzle['id']) for puzzle in puzzles.values()]
+        files = {
+            file['_id']: file
+            for file in db.fs.files.find({'_id': {'$in': file_ids}}, {'filename': 1, 'variants': 1})
+        }
 
         image_data = []
-        for file_id in image_set['file_ids']:
-            file = fs.get(ObjectId(image_set['file_ids'][file_id]['id']))
+        for puzzle in puzzles.values():
+            file = files.get(ObjectId(puzzle['id']), {})
             image_data.append({
-                'id': image_set['file_ids'][file_id]['id'],
-                'filename': file.filename,
-                'url': f"/image/{image_set['file_ids'][file_id]['id']}"
+                'id': puzzle['id'],
+                'filename': file.get('filename'),
+                'variants': sorted(file.get('variants', {})),
+                'url': f"/image/{puzzle['id']}"
             })
 
         return jsonify({'images': image_data}), 200
@@ -257,19 +309,30 @@ def get_images_by_title():
 
 @images_bp.route('/imagesets', methods=['GET'])
 def get_image_sets():
+    if wants_ndjson():
+        return ndjson_response(db.image_sets.find({}).sort('_id', -1))
+
     try:
-        # Fetch all records from the image_sets collection, sorted by _id in descending order
-        image_sets = list(db.image_sets.find({}).sort('_id', -1))
-        
-        # Convert ObjectId to string and return all fields
-        for image_set in image_sets:
-            image_set['_id'] = str(image_set['_id'])  # Convert ObjectId to string
-        
+        image_sets = image_set_cache.get(ALL_LEVELS)
+        if image_sets is None:
+            generation = image_set_cache.generation()
+            # Fetch all records from the image_sets collection, sorted by _id in descending order
+            image_sets = list(db.image_sets.find({}).sort('_id', -1))
+
+            # Convert ObjectId to string and return all fields
+            for image_set in image_sets:
+                image_set['_id'] = str(image_set['_id'])  # Convert ObjectId to string
+            image_set_cache.set(ALL_LEVELS, image_sets, generation)
+
         return jsonify(image_sets), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@images_bp.route('/imagesets/cache-stats', methods=['GET'])
+def get_image_set_cache_stats():
+    return jsonify(image_set_cache.stats()), 200
+
 @images_bp.route('/images/solutions', methods=['GET'])
 def get_images_by_solutions():
     title = request.args.get('title')
@@ -310,21 +373,25 @@ def get_level_images():
         return jsonify({'error': 'Level parameter is required'}), 400
 
     try:
-        # Query to find image sets that match the specified level
-        image_sets = db.image_sets.find({'level': level}).sort('_id', -1)
-        
-        sets_data = []
-        for image_set in image_sets:
-            sets_data.append({
-                        'level': image_set.get('level', ''),
-                        'live': image_set.get('live', ''),
-                        'title': image_set.get('title', ''),
-                        'category': image_set.get('category', ''),
-                        'live_link': image_set.get('live_link', ''),  # Use get() to handle optional field
-                        'date_time': image_set.get('date_time', ''),
-                        'file_ids': image_set.get('file_ids', {})
-            })
-        
+        sets_data = image_set_cache.get(level)
+        if sets_data is None:
+            generation = image_set_cache.generation()
+            # Query to find image sets that match the specified level
+            image_sets = db.image_sets.find({'level': level}).sort('_id', -1)
+
+            sets_data = []
+            for image_set in image_sets:
+                sets_data.append({
+                            'level': image_set.get('level', ''),
+                            'live': image_set.get('live', ''),
+                            'title': image_set.get('title', ''),
+                            'category': image_set.get('category', ''),
+                            'live_link': image_set.get('live_link', ''),  # Use get() to handle optional field
+                            'date_time': image_set.get('date_time', ''),
+                            'file_ids': image_set.get('file_ids', {})
+                })
+            image_set_cache.set(level, sets_data, generation)
+
         if not sets_data:
             return jsonify({'message': 'No image sets found for this level'}), 404
 
@@ -337,14 +404,45 @@ def image_fileid_get():
     try:
         data = request.get_json()
         file_id = data['file_id']
-        
-        file = fs.get(ObjectId(file_id))
-        return send_file(BytesIO(file.read()), mimetype=file.content_type, as_attachment=False, download_name=file.filename)
-    except errors.PyMongoError as e:
-        return jsonify({'error': str(e)}), 500
+        return _send_image(file_id, data.get('variant'))
     except KeyError:
         return jsonify({'error': 'File ID is required'}), 400
 
+# GET variant of /image_get_fileid. Browsers and CDNs only revalidate and
+# issue Range requests for GET, so this one answers If-None-Match with 304
+# and serves partial content.
+@images_bp.route('/image_get_fileid/<file_id>', methods=['GET'])
+def image_fileid_get_by_path(file_id):
+    return _send_image(file_id, request.args.get('variant'))
+
+def _send_image(file_id, variant=None):
+    """Send an original from GridFS, or one of its VARIANTS when requested.
+
+    Originals without the requested variant (not yet backfilled, or not an
+    image) fall back to the original itself.
+    """
+    from gridfs.errors import NoFile
+
+    if variant and variant not in VARIANTS:
+        return jsonify({'error': f'Variant must be one of {list(VARIANTS)}'}), 400
+
+    try:
+        file_id = ObjectId(file_id)
+        if variant:
+            original = db.fs.files.find_one({'_id': file_id}, {f'variants.{variant}': 1})
+            if original is None:
+                return jsonify({'error': 'File not found'}), 404
+            file_id = original.get('variants', {}).get(variant, file_id)
+
+        file = fs.get(file_id)
+        return send_grid_out(file, max_age=config.IMAGE_MAX_AGE)
+    except InvalidId:
+        return jsonify({'error': 'Invalid file ID'}), 400
+    except NoFile:
+        return jsonify({'error': 'File not found'}), 404
+    except errors.PyMongoError as e:
+        return jsonify({'error': str(e)}), 500
+
 
 @images_bp.route('/delete-arena-title', methods=['DELETE'])
 def delete_images():
@@ -362,34 +460,25 @@ def delete_images():
             return jsonify({'error': 'Title and level are required'}), 400
 
         # Find the image set to be deleted
-        image_set = db.image_sets.find_one({'title': title, 'level': level,'category':category})
-        print("imm",image_set)
+        image_set = db.image_sets.find_one({'title': title, 'level': level,'category':category}, {'file_ids': 1})
         if not image_set:
             return jsonify({'error': 'No image set found with the specified title'}), 404
 
-        file_ids = image_set.get('file_ids', [])
-
-        # Loop over each file_id and delete related records from fs.files and fs.chunks
-        for file_id_obj in file_ids:
-            try:
-                print("hi",file_ids[file_id_obj])
-                print(file_ids[file_id_obj]["id"])
-                 # file_id_obj = file_id
-                
-                # Delete the file document from fs.files
-                fs_files_delete_result = db.fs.files.delete_one({'_id': ObjectId(file_ids[file_id_obj]["id"])})
-                
-                if fs_files_delete_result.deleted_count == 0:
-                    return jsonify({'error': f'File with id {file_id_obj} not found in fs.files'}), 404
- 
-                # Delete the related chunks from fs.chunks
-                fs_chunks_delete_result = db.fs.chunks.delete_many({'files_id': ObjectId(file_ids[file_id_obj]["id"])})
+        file_ids = image_set.get('file_ids', {})
 
-            except errors.PyMongoError as e:
-                return jsonify({'error': f'Error deleting file or chunks with id  : {str(e)}'}), 500
+        # Drop this set's reference to each blob in one batch. Blobs shared
+        # with other image sets are kept; fs.files and fs.chunks are only
+        # deleted once the last reference is gone.
+        try:
+            missing = release_blobs(db, [ObjectId(puzzle['id']) for puzzle in file_ids.values()])
+        except errors.PyMongoError as e:
+            return jsonify({'error': f'Error deleting file or chunks: {str(e)}'}), 500
+        if missing:
+            print(f"Files already missing from fs.files: {missing}")
 
         # Delete the entire image set document
         delete_result = db.image_sets.delete_one({'title': title, 'level': level,'category':category})
+        invalidate_image_sets(level)
         if delete_result.deleted_count == 0:
             return jsonify({'error': 'Failed to delete the image set document'}), 500
 
@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify
+from pymongo import errors
+from app.config import config
+from app.database import users_collection
+from app.utils.cache import LRUCache
+
+leaderboard_bp = Blueprint('leaderboard', __name__)
+
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 100
+LEADERBOARD_FIELDS = {'_id': 0, 'name': 1, 'email': 1, 'image': 1, 'level': 1, 'puzzle_score': 1}
+
+# Standings may lag by LEADERBOARD_CACHE_TTL seconds; during a live class
+# every student polls these, so most calls never reach MongoDB
+leaderboard_cache = LRUCache(maxsize=config.LEADERBOARD_CACHE_SIZE, ttl=config.LEADERBOARD_CACHE_TTL)
+
+@leaderboard_bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    level = request.args.get('level')
+    if not level:
+        return jsonify({'error': 'Level parameter is required'}), 400
+    try:
+        k = min(int(request.args.get('k', DEFAULT_TOP_K)), MAX_TOP_K)
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+    if k < 1:
+        return jsonify({'error': 'k must be positive'}), 400
+
+    key = ('top', level, k)
+    leaders = leaderboard_cache.get(key)
+    if leaders is None:
+        try:
+            # Walks the (level, puzzle_score, _id) index; no sort in memory
+            leaders = list(
+                users_collection.find({'level': level}, LEADERBOARD_FIELDS)
+                .sort([('puzzle_score', -1), ('_id', 1)])
+                .limit(k)
+            )
+        except errors.PyMongoError as e:
+            return jsonify({'error': str(e)}), 500
+        for position, user in enumerate(leaders):
+            user.setdefault('puzzle_score', 0)
+            user['rank'] = position + 1
+        leaderboard_cache.set(key, leaders)
+
+    return jsonify({'level': level, 'leaders': leaders}), 200
+
+@leaderboard_bp.route('/leaderboard/rank', methods=['GET'])
+def get_leaderboard_rank():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({'error': 'Email parameter is required'}), 400
+
+    key = ('rank', email)
+    standing = leaderboard_cache.get(key)
+    if standing is None:
+        try:
+            user = users_collection.find_one({'email': email}, {'_id': 0, 'level': 1, 'puzzle_score': 1})
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            level = user.get('level')
+            score = user.get('puzzle_score', 0)
+            # Students with the same score share a rank; both counts are
+            # answered from the index without reading any document
+            ahead = users_collection.count_documents({'level': level, 'puzzle_score': {'$gt': score}})
+            total = users_collection.count_documents({'level': level})
+        except errors.PyMongoError as e:
+            return jsonify({'error': str(e)}), 500
+        standing = {'email': email, 'level': level, 'puzzle_score': score, 'rank': ahead + 1, 'total': total}
+        leaderboard_cache.set(key, standing)
+
+    return jsonify(standing), 200
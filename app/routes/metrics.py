@@ -0,0 +1,14 @@
+from flask import Blueprint, Response, jsonify
+from app.config import config
+from app.utils.auth import bearer_matches
+from app.utils.metrics import CONTENT_TYPE, render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Route and MongoDB traffic details are not public: scrapers send
+    # 'Authorization: Bearer <METRICS_TOKEN>'
+    if not bearer_matches(config.METRICS_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -1,6 +1,8 @@
 from bson import ObjectId
 from flask import Blueprint, request, jsonify
-from app.database import admin_collection
+from app.database import sessions_collection
+from app.utils.schedule import serialize, start_queries, starts_at_of, window_query
+from app.utils.streaming import ndjson_response, wants_ndjson
 import re
 
 sessions_bp = Blueprint('sessions', __name__)
@@ -13,25 +15,29 @@ def add_session():
         if field not in data:
             return jsonify({'error': f"'{field}' is required"}), 400
 
+    data['starts_at'] = starts_at_of(data)
+    if data['starts_at'] is None:
+        return jsonify({'error': "'date' and 'time' must be a valid date and time"}), 400
+
     try:
-        # Add the new session to the first document in the collection
-        result = admin_collection.update_one(
-            {},  # match the first document
-            {'$push': {'sessions': data}}
-        )
-        if result.modified_count == 1:
-            return jsonify({'message': 'Session added successfully'}), 201
-        else:
-            return jsonify({'error': 'No document was updated'}), 500
+        result = sessions_collection.insert_one(data)
+        return jsonify({'message': 'Session added successfully', 'id': str(result.inserted_id)}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @sessions_bp.route('/sessions', methods=['GET'])
 def view_sessions():
     try:
-        sessions = list(admin_collection.find())
-        for session in sessions:
-            session['_id'] = str(session['_id'])
+        query, limit = window_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = sessions_collection.find(query).sort('starts_at', 1).limit(limit)
+    if wants_ndjson():
+        return ndjson_response(cursor)
+
+    try:
+        sessions = [serialize(session) for session in cursor]
         return jsonify(sessions), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -45,13 +51,12 @@ def delete_session():
         return jsonify({"error": "Date and time must be provided to delete a session"}), 400
 
     try:
-        # Remove the session from the sessions field
-        result = admin_collection.update_one(
-            {"sessions": {"$elemMatch": {"date": data['date'], "time": data['time']}}},
-            {"$pull": {"sessions": {"date": data['date'], "time": data['time']}}}
-        )
+        for query in start_queries(data['date'], data['time']):
+            result = sessions_collection.delete_one(query)
+            if result.deleted_count > 0:
+                break
 
-        if result.modified_count > 0:
+        if result.deleted_count > 0:
             return jsonify({"message": "Session deleted successfully"}), 200
         else:
             return jsonify({"error": "Session not found"}), 404
@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from app.config import config
+from app.utils import query_monitor
+from app.utils.auth import bearer_matches
+
+slow_queries_bp = Blueprint('slow_queries', __name__)
+
+@slow_queries_bp.route('/slow-queries', methods=['GET'])
+def get_slow_queries():
+    if not bearer_matches(config.METRICS_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if query_monitor.monitor is None:
+        return jsonify({'error': 'Slow query monitor is not enabled'}), 404
+    findings = query_monitor.monitor.findings()
+    return jsonify({
+        'threshold_ms': query_monitor.monitor.threshold_micros / 1000,
+        'collection_scans': sum(1 for finding in findings if finding['collscan']),
+        'queries': findings,
+    }), 200
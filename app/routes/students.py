@@ -1,19 +1,85 @@
+from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, request, jsonify
 from app.database import users_collection
+from app.utils.puzzle_progress import progress_collection
+from app.utils.streaming import ndjson_response, wants_ndjson
+import re
 
 students_bp = Blueprint('students', __name__)
 
+# Fields returned by /studentList unless ?fields=all is given
+STUDENT_LIST_FIELDS = ['name', 'email', 'level', 'contactNumber', 'image', 'puzzle_score', 'scores']
+# Never sent in listings, even with ?fields=all
+PRIVATE_FIELDS = ['otp', 'session_id']
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
 @students_bp.route('/studentList', methods=['GET'])
 def get_studentList():
+    """Keyset-paginated student listing.
+
+    Query parameters: `limit` (default 100, max 500), `after` (the
+    X-Next-Cursor value of the previous page), `level`, `name` (prefix
+    match) and `fields=all` for the full documents. The body stays a JSON
+    array; X-Next-Cursor is only set when another page exists. With
+    `Accept: application/x-ndjson` the selection is streamed instead.
+    """
     try:
-        documents = list(users_collection.find({}, {'_id': 0}))
-        if documents:
-            return jsonify(documents), 200
-        else:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    query = {}
+    if request.args.get('level'):
+        query['level'] = request.args['level']
+    if request.args.get('name'):
+        query['name'] = {'$regex': f"^{re.escape(request.args['name'])}"}
+    after = request.args.get('after')
+    if after:
+        try:
+            query['_id'] = {'$gt': ObjectId(after)}
+        except InvalidId:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    if request.args.get('fields') == 'all':
+        projection = {field: 0 for field in PRIVATE_FIELDS}
+    else:
+        projection = {field: 1 for field in STUDENT_LIST_FIELDS}
+
+    if wants_ndjson():
+        # Exports stream the whole selection unless a limit was asked for
+        cursor = users_collection.find(query, projection).sort('_id', 1)
+        if 'limit' in request.args:
+            cursor = cursor.limit(limit)
+        return ndjson_response(cursor, _without_id)
+
+    try:
+        # Fetch one extra document to learn whether another page exists
+        documents = list(users_collection.find(query, projection).sort('_id', 1).limit(limit + 1))
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = str(documents[-1]['_id'])
+        for document in documents:
+            del document['_id']
+
+        if not documents and not after:
             return jsonify({"error": "No records found"}), 404
+
+        response = jsonify(documents)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _without_id(document):
+    document.pop('_id', None)
+    return document
+
 @students_bp.route('/del-student', methods=['DELETE'])
 def delete_student():
     try:
@@ -23,6 +89,7 @@ def delete_student():
 
         result = users_collection.delete_one({"email": email})
         if result.deleted_count > 0:
+            progress_collection().delete_many({"email": email})
             return jsonify({"message": "Student record deleted successfully"}), 200
         else:
             return jsonify({"error": "Student record not found"}), 404
@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify
-from app.database import admin_collection
+from app.database import tournaments_collection
+from app.utils.schedule import serialize, starts_at_of, window_query
+from app.utils.streaming import ndjson_response, wants_ndjson
 from bson import ObjectId
 from pymongo import errors
 
@@ -20,7 +22,10 @@ def create_tournament():
             'type': data['type'],
             'description': data['description']
         }
-        result = admin_collection.insert_one(tournament)
+        tournament['starts_at'] = starts_at_of(tournament)
+        if tournament['starts_at'] is None:
+            return jsonify({'error': "'date' must be a valid date"}), 400
+        result = tournaments_collection.insert_one(tournament)
         return jsonify({'message': 'Tournament created successfully', 'id': str(result.inserted_id)}), 201
     except errors.PyMongoError as e:
         return jsonify({'error': str(e)}), 500
@@ -36,14 +41,18 @@ def update_tournament1():
             return jsonify({"error": "Type and tournament details are required"}), 400
 
         # Prepare the update dictionary
-        update_fields = {f"tournaments.$.{key}": value for key, value in tournament_updates.items() if value is not None}
+        update_fields = {key: value for key, value in tournament_updates.items() if value is not None and key not in ('_id', 'starts_at')}
 
         if not update_fields:
             return jsonify({"error": "No valid fields to update"}), 400
+        if 'date' in update_fields:
+            update_fields['starts_at'] = starts_at_of(update_fields)
+            if update_fields['starts_at'] is None:
+                return jsonify({"error": "'date' must be a valid date"}), 400
 
         # Update the specified tournament
-        result = admin_collection.update_one(
-            {"tournaments.type": tournament_type},
+        result = tournaments_collection.update_one(
+            {"type": tournament_type},
             {
                 "$set": update_fields
             }
@@ -61,20 +70,26 @@ def update_tournament1():
 @tournaments_bp.route('/tournaments/<tournament_id>', methods=['GET'])
 def get_tournament(tournament_id):
     try:
-        tournament = admin_collection.find_one({'_id': ObjectId(tournament_id)})
+        tournament = tournaments_collection.find_one({'_id': ObjectId(tournament_id)})
         if not tournament:
             return jsonify({'error': 'Tournament not found'}), 404
-        tournament['_id'] = str(tournament['_id'])
-        return jsonify(tournament), 200
+        return jsonify(serialize(tournament)), 200
     except errors.PyMongoError as e:
         return jsonify({'error': str(e)}), 500
 
 @tournaments_bp.route('/tournaments', methods=['GET'])
 def get_tournaments():
     try:
-        tournaments = list(admin_collection.find())
-        for tournament in tournaments:
-            tournament['_id'] = str(tournament['_id'])
+        query, limit = window_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = tournaments_collection.find(query).sort('starts_at', 1).limit(limit)
+    if wants_ndjson():
+        return ndjson_response(cursor)
+
+    try:
+        tournaments = [serialize(tournament) for tournament in cursor]
         return jsonify(tournaments), 200
     except errors.PyMongoError as e:
         return jsonify({'error': str(e)}), 500
@@ -86,9 +101,13 @@ def update_tournament(tournament_id):
     for field in ['name', 'date', 'type', 'description']:
         if field in data:
             update_fields[field] = data[field]
+    if 'date' in update_fields:
+        update_fields['starts_at'] = starts_at_of(update_fields)
+        if update_fields['starts_at'] is None:
+            return jsonify({'error': "'date' must be a valid date"}), 400
 
     try:
-        result = admin_collection.update_one({'_id': ObjectId(tournament_id)}, {'$set': update_fields})
+        result = tournaments_collection.update_one({'_id': ObjectId(tournament_id)}, {'$set': update_fields})
         if result.matched_count > 0:
             return jsonify({'message': 'Tournament updated successfully'}), 200
         else:
@@ -99,7 +118,7 @@ def update_tournament(tournament_id):
 @tournaments_bp.route('/tournaments/<tournament_id>', methods=['DELETE'])
 def delete_tournament(tournament_id):
     try:
-        result = admin_collection.delete_one({'_id': ObjectId(tournament_id)})
+        result = tournaments_collection.delete_one({'_id': ObjectId(tournament_id)})
         if result.deleted_count > 0:
             return jsonify({'message': 'Tournament deleted successfully'}), 200
         else:
@@ -1,6 +1,8 @@
 from bson import ObjectId
 from flask import Blueprint, request, jsonify
-from app.database import admin_collection
+from app.database import upcoming_activities_collection
+from app.utils.schedule import serialize, start_queries, starts_at_of, window_query
+from app.utils.streaming import ndjson_response, wants_ndjson
 import re
 
 upcomming_bp = Blueprint('upcomingActivities', __name__)
@@ -13,16 +15,31 @@ def add_upcomingActivities():
         if field not in data:
             return jsonify({'error': f"'{field}' is required"}), 400
 
+    data['starts_at'] = starts_at_of(data)
+    if data['starts_at'] is None:
+        return jsonify({'error': "'date' and 'time' must be a valid date and time"}), 400
+
     try:
-        # Add the new upcomingActivities to the first document in the collection
-        result = admin_collection.update_one(
-            {},  # match the first document
-            {'$push': {'upcoming_activities': data}}
-        )
-        if result.modified_count == 1:
-            return jsonify({'message': 'upcomingActivities added successfully'}), 201
-        else:
-            return jsonify({'error': 'No document was updated'}), 500
+        result = upcoming_activities_collection.insert_one(data)
+        return jsonify({'message': 'upcomingActivities added successfully', 'id': str(result.inserted_id)}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@upcomming_bp.route('/upcomingActivities', methods=['GET'])
+def view_upcomingActivities():
+    try:
+        query, limit = window_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cursor = upcoming_activities_collection.find(query).sort('starts_at', 1).limit(limit)
+    if wants_ndjson():
+        return ndjson_response(cursor)
+
+    try:
+        activities = [serialize(activity) for activity in cursor]
+        return jsonify(activities), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -36,13 +53,12 @@ def delete_upcomingActivities():
         return jsonify({"error": "Date and time must be provided to delete a upcomingActivities"}), 400
 
     try:
-        # Remove the upcomingActivities from the upcomingActivitiess field
-        result = admin_collection.update_one(
-            {"upcoming_activities": {"$elemMatch": {"date": data['date'], "time": data['time'],"title":data["title"]}}},
-            {"$pull": {"upcoming_activities": {"date": data['date'], "time": data['time'],"title":data["title"]}}}
-        )
+        for query in start_queries(data['date'], data['time']):
+            result = upcoming_activities_collection.delete_one({**query, "title": data["title"]})
+            if result.deleted_count > 0:
+                break
 
-        if result.modified_count > 0:
+        if result.deleted_count > 0:
             return jsonify({"message": "upcomingActivities deleted successfully"}), 200
         else:
             return jsonify({"error": "upcomingActivities not found"}), 404
@@ -1,43 +1,73 @@
 from flask import Blueprint, request, jsonify
 from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from app import database
 from app.database import users_collection
 import random
-import smtplib
-import os
 import uuid
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from app.utils.email_utils import otp_email
+from app.utils.outbox import send_through_outbox
+from app.utils import puzzle_progress
+from app.utils.puzzle_stats import apply_attempt, get_stats, record_attempt
+from app.utils.scores import CATEGORIES, reconcile_scores, score_delta
 
 users_bp = Blueprint('users', __name__)
 
-# Email configuration
-SENDER_EMAIL = os.getenv('SENDER_EMAIL', 'connect@chesschamps.us')
-SENDER_PASSWORD = os.getenv('SENDER_PASSWORD', 'iyln tkpp vlpo sjep')
-
-# Utility function to send OTP via email
+# Utility function to send the OTP email through the outbox, which retries failures
 def send_otp(email, otp):
     try:
-        subject = "Your OTP for Sign-In to Kids Learning Portal"
-        body = f"Your OTP is {otp} "
-
-        # Set up the MIME
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Connect to Gmail's SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(SENDER_EMAIL, email, text)
-        server.quit()
-
-        print("OTP sent successfully.")
+        subject, body = otp_email(otp)
+        _, sent = send_through_outbox(email, subject, body, kind='otp')
+        print("OTP sent successfully." if sent else "OTP queued for delivery.")
     except Exception as e:
-        print(f"Failed to send OTP: {e}")
+        print(f"Failed to queue OTP: {e}")
+
+# None until the first answer finds out whether the deployment runs
+# transactions (replica sets and mongos do, a standalone mongod does not)
+_transactions_supported = None
+
+def _apply_answer(email, category, title, puzzle_no, score, option_guessed, timer, session=None):
+    updated = puzzle_progress.record_answer(email, category, title, puzzle_no, score, option_guessed, timer, session=session)
+    if not updated:
+        return None, None, None
+    # `updated` is the progress document as it was before this write
+    before = updated.get('puzzles', {}).get(puzzle_no)
+    after = apply_attempt(before, score, option_guessed, timer)
+    delta = score_delta(before, after)
+    if delta:
+        if session is not None:
+            users_collection.update_one({'email': email}, {'$inc': {f'scores.{category}': delta}}, session=session)
+        else:
+            try:
+                users_collection.update_one({'email': email}, {'$inc': {f'scores.{category}': delta}})
+            except PyMongoError as e:
+                # The answer is stored but the counter missed it: have
+                # /calculate_scores rebuild it from puzzle_progress
+                print(f"Score update failed for {email}: {e}")
+                users_collection.update_one({'email': email}, {'$set': {'scores_reconciled': False}})
+    return updated, before, after
+
+def answer_puzzle(email, category, title, puzzle_no, score, option_guessed, timer):
+    """Store one answer and move users.scores by the same amount.
+
+    Both writes run in one transaction when the deployment supports it.
+    Returns (progress before, puzzle before, puzzle after), or Nones when
+    nothing was written.
+    """
+    global _transactions_supported
+    args = (email, category, title, puzzle_no, score, option_guessed, timer)
+    if _transactions_supported is not False:
+        try:
+            with database.client.start_session() as session:
+                result = session.with_transaction(lambda s: _apply_answer(*args, session=s))
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            # IllegalOperation: transactions need a replica set or mongos
+            if e.code != 20 or _transactions_supported:
+                raise
+            _transactions_supported = False
+    return _apply_answer(*args)
 
 # Signup API
 @users_bp.route('/signup', methods=['POST'])
@@ -53,8 +83,12 @@ def signup():
         if existing_user:
             return jsonify({'error': 'User already exists. Please login.'}), 400 
         
-        # Add new user data
-        users_collection.insert_one(user_data)
+        # Add new user data; the unique email index rejects an existing
+        # email even when its contact number or level differ
+        try:
+            users_collection.insert_one(user_data)
+        except DuplicateKeyError:
+            return jsonify({'error': 'User already exists. Please login.'}), 400
         return jsonify({'success': True}), 201
     else:
         return jsonify({'error': 'Invalid data format.'}), 400
@@ -162,42 +196,23 @@ def calculate_scores():
     
     email = data['email']
     
-    # Retrieve the user from the database
-    user = users_collection.find_one({'email': email})
-    
+    # scores.<category> is kept current by /update_puzzle_started, so this
+    # is a projected read of four counters
+    user = users_collection.find_one({'email': email}, {'scores': 1, 'scores_reconciled': 1})
+
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
 
-    # Initialize scores dictionary
-    scores = {
-        "Opening": 0,
-        "Middlegame": 0,
-        "Endgame": 0,
-        "Mixed": 0
-    }
-    
-    # Calculate scores for each category
-    puzzle_arena = user.get('PuzzleArena', {})
-    
-    for category in scores.keys():
-        category_arena = puzzle_arena.get(category, {})
-        for puzzle_set in category_arena.values():
-            for puzzle in puzzle_set.values():
-                scores[category] += puzzle.get('score', 0)
-    
-    # Update the user's record with the calculated scores
-    update_result = users_collection.update_one(
-        {'email': email},
-        {'$set': {'scores': scores}}
-    )
-    
-    # Log the result for debugging
-    print(f"Update result: {update_result.raw_result}")
-    
-    if update_result.modified_count > 0:
-        return jsonify({'success': True, 'scores': scores}), 200
-    else:
-        return jsonify({'success': True, 'scores': scores}), 200
+    if not user.get('scores_reconciled'):
+        # Counters written before incremental scoring may be stale; rebuild
+        # them once from puzzle_progress on the server
+        puzzle_progress.migrate_legacy(email)
+        reconcile_scores(users_collection, puzzle_progress.progress_collection(), {'email': email})
+        user = users_collection.find_one({'email': email}, {'scores': 1})
+
+    stored_scores = user.get('scores', {})
+    scores = {category: stored_scores.get(category, 0) for category in CATEGORIES}
+    return jsonify({'success': True, 'scores': scores}), 200
 
 # Your existing database collection
 # Make sure to initialize `users_collection` appropriately in your actual code
@@ -216,21 +231,16 @@ def get_arena_user_details():
     if category not in default_categories:
         return jsonify({'success': False, 'message': f'Category must be one of {default_categories}'}), 400
     
-    # Retrieve the user from the database
-    user = users_collection.find_one({'email': email})
-    
+    # Only this title's progress document is read
+    progress = puzzle_progress.find_title(email, category, title)
+    if progress and progress.get('puzzles'):
+        return jsonify({'success': True, 'puzzleArena': progress['puzzles']}), 200
+
+    user = users_collection.find_one({'email': email}, {'has_puzzle_arena': 1})
     if user:
-        if 'PuzzleArena' not in user:
+        if not user.get('has_puzzle_arena'):
             return jsonify({'success': False, 'message': 'PuzzleArena field not found'}), 200
-        # Check if the PuzzleArena exists and contains the specified category and title
-        puzzle_arena = user.get('PuzzleArena', {})
-        category_arena = puzzle_arena.get(category, {})
-        puzzles = category_arena.get(title, {})
-        
-        if puzzles:
-            return jsonify({'success': True, 'puzzleArena': puzzles}), 200
-        else:
-            return jsonify({'success': False, 'message': 'PuzzleArena details not found for the specified category and title'}), 200
+        return jsonify({'success': False, 'message': 'PuzzleArena details not found for the specified category and title'}), 200
     else:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     
@@ -254,34 +264,19 @@ def arena_user_details():
     if category not in default_categories:
         return jsonify({'success': False, 'message': f'Category must be one of {default_categories}'}), 400
     
-    # Retrieve the user from the database
-    user = users_collection.find_one({'email': email})
-    
-    if user:
-        # Initialize PuzzleArena if not present
-        if 'PuzzleArena' not in user:
-            user['PuzzleArena'] = {cat: {} for cat in default_categories}
-        
-        if title not in user['PuzzleArena'][category]:
-            # Create new puzzles if title doesn't exist
-            puzzles = {f'Puzzle{i+1}': {'started': False, 'option_guessed': None,'timer': 0, 'score': 0} for i in range(puzzle_no)}
-            user['PuzzleArena'][category][title] = puzzles
-        else:
-            # Append new puzzles only if more are needed
-            existing_puzzles = user['PuzzleArena'][category][title]
-            current_max_puzzle_no = len(existing_puzzles)
-            
-            if puzzle_no > current_max_puzzle_no:
-                # Calculate how many new puzzles are needed
-                new_puzzles = {f'Puzzle{i+current_max_puzzle_no+1}': {'started': False, 'option_guessed': None,'timer': 0, 'score': 0} for i in range(puzzle_no - current_max_puzzle_no)}
-                existing_puzzles.update(new_puzzles)
-        
-        # Save the updated user back to the database
-        users_collection.update_one({'email': email}, {'$set': user})
-        
-        return jsonify({'success': True, 'message': user['PuzzleArena']}), 200
-    else:
+    user = users_collection.find_one_and_update(
+        {'email': email},
+        {'$set': {'has_puzzle_arena': True}},
+        projection={'email': 1, 'level': 1, 'PuzzleArena': 1}
+    )
+    if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
+    if 'PuzzleArena' in user:
+        puzzle_progress.migrate_user_document(user)
+
+    # Write only the puzzle slots: existing slots keep their progress
+    puzzles = puzzle_progress.ensure_title(email, category, title, user.get('level'), puzzle_no)
+    return jsonify({'success': True, 'message': puzzles}), 200
 
 
 
@@ -303,44 +298,43 @@ def update_puzzle_started():
     if category not in default_categories:
         return jsonify({'success': False, 'message': f'Category must be one of {default_categories}'}), 400
 
-    # Retrieve the user from the database
-    user = users_collection.find_one({'email': email})
+    # One conditional write instead of read-modify-write, so answers from
+    # two tabs cannot overwrite each other. Puzzles already solved (score 1)
+    # are skipped, and a stored wrong guess forces score 0 from then on.
+    updated, before, after = answer_puzzle(email, category, title, puzzle_no, score, option_guessed, timer)
+    if updated is None and puzzle_progress.migrate_legacy(email):
+        updated, before, after = answer_puzzle(email, category, title, puzzle_no, score, option_guessed, timer)
 
-    if user:
-        # Check if the specified title and category exist in the user's PuzzleArena
-        if category in user.get('PuzzleArena', {}) and title in user['PuzzleArena'][category]:
-            # Update the started flag and score if provided
-            puzzle_data = user['PuzzleArena'][category][title].get(puzzle_no, {})
-            puzzle_data['started'] = True
-            if (puzzle_data['score']==1):
-                return jsonify({'success': True, 'message': 'Puzzle started flag and score updated successfully'}), 200
-
-            # Check the existing value of option_guessed in the database
-            existing_option_guessed = puzzle_data.get('option_guessed', None)
-            
-            if existing_option_guessed is False:
-                # If option_guessed is False in the database, set score to 0
-                puzzle_data['score'] = 0
-                
-            elif score is not None:
-                # Otherwise, update the score as provided
-                puzzle_data['score'] = score
-
-            # Update option_guessed based on the input, unless it's False in the database
-            if option_guessed is not None:
-                puzzle_data['option_guessed'] = option_guessed
-            puzzle_data['timer']=timer
-            # Update the user document in the database
-            users_collection.update_one(
-                {'email': email},
-                {'$set': {f'PuzzleArena.{category}.{title}.{puzzle_no}': puzzle_data}}
-            )
+    if updated:
+        record_attempt(category, title, updated.get('level'), puzzle_no, before, after)
+        return jsonify({'success': True, 'message': 'Puzzle started flag and score updated successfully'}), 200
 
-            return jsonify({'success': True, 'message': 'Puzzle started flag and score updated successfully'}), 200
-        else:
-            return jsonify({'success': False, 'message': 'Specified category or title not found'}), 404
-    else:
-        return jsonify({'success': False, 'message': 'User not found'}), 404
+    # Nothing matched: work out why
+    if not puzzle_progress.title_exists(email, category, title):
+        if not users_collection.find_one({'email': email}, {'_id': 1}):
+            return jsonify({'success': False, 'message': 'User not found'}), 404
+        return jsonify({'success': False, 'message': 'Specified category or title not found'}), 404
+
+    # The puzzle was already solved; its score stays 1
+    return jsonify({'success': True, 'message': 'Puzzle started flag and score updated successfully'}), 200
+
+@users_bp.route('/puzzle_stats', methods=['GET'])
+def get_puzzle_stats():
+    category = request.args.get('category')
+    title = request.args.get('title')
+    level = request.args.get('level')
+
+    if not all([category, title]):
+        return jsonify({'success': False, 'message': 'Category and title are required'}), 400
+    if category not in CATEGORIES:
+        return jsonify({'success': False, 'message': f'Category must be one of {CATEGORIES}'}), 400
+
+    try:
+        puzzles = get_stats(puzzle_progress.progress_collection(), category, title, level)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    return jsonify({'success': True, 'category': category, 'title': title, 'level': level, 'puzzles': puzzles}), 200
 
 @users_bp.route('/get_visited_info', methods=['GET'])
 def get_puzzle_visited_info():
@@ -357,18 +351,17 @@ def get_puzzle_visited_info():
     if category not in default_categories:
         return jsonify({'success': False, 'message': f'Category must be one of {default_categories}'}), 400
 
-    # Retrieve the user from the database
-    user = users_collection.find_one({'email': email})
+    # Read just this puzzle from the title's progress document
+    puzzle_path = f'puzzles.{puzzle_no}'
+    progress = puzzle_progress.find_title(email, category, title, {'_id': 0, puzzle_path: 1})
 
-    if user:
-        # Check if the specified category and title exist in the user's PuzzleArena
-        if category in user.get('PuzzleArena', {}) and title in user['PuzzleArena'][category]:
-            puzzle_data = user['PuzzleArena'][category][title].get(puzzle_no, {})
-            option_guessed = puzzle_data.get('option_guessed', None)
+    if progress is not None:
+        puzzle_data = progress.get('puzzles', {}).get(puzzle_no, {})
+        option_guessed = puzzle_data.get('option_guessed', None)
 
-            return jsonify({'success': True, 'option_guessed': option_guessed}), 200
-        else:
-            return jsonify({'success': False, 'message': 'Specified category or title not found'}), 404
+        return jsonify({'success': True, 'option_guessed': option_guessed}), 200
+    elif users_collection.find_one({'email': email}, {'_id': 1}):
+        return jsonify({'success': False, 'message': 'Specified category or title not found'}), 404
     else:
         return jsonify({'success': False, 'message': 'User not found'}), 404
 
@@ -426,6 +419,10 @@ def update_user_level():
         )
 
         if user:
+            # Progress carries the level for /puzzle_stats?level=
+            puzzle_progress.progress_collection().update_many(
+                {'email': user.get('email')}, {'$set': {'level': user_level}}
+            )
             user_details = {
                 'name': user.get('name', ''),
                 'email': user.get('email', ''),
@@ -452,22 +449,20 @@ def update_puzzle_score():
     
     if addscoretopuzzle is None:
         return jsonify({'success': False, 'message': 'addscoretopuzzle parameter is required'}), 400
+
+    if isinstance(addscoretopuzzle, bool) or not isinstance(addscoretopuzzle, (int, float)):
+        return jsonify({'success': False, 'message': 'addscoretopuzzle must be a number'}), 400
     
     try:
-        # Search for the user by email
-        user = users_collection.find_one({'email': email})
-        
-        if user:
-            # Check if "puzzle score" field exists and update it
-            puzzle_score = user.get('puzzle_score', 0)  # Default to 0 if not present
-            new_puzzle_score = puzzle_score + addscoretopuzzle
-            
-            updated_user = users_collection.find_one_and_update(
-                {'email': email},
-                {'$set': {'puzzle_score': new_puzzle_score}},
-                return_document=ReturnDocument.AFTER
-            )
-            
+        # Atomic increment; concurrent score updates no longer overwrite each other
+        updated_user = users_collection.find_one_and_update(
+            {'email': email},
+            {'$inc': {'puzzle_score': addscoretopuzzle}},
+            projection={'_id': 0, 'name': 1, 'email': 1, 'image': 1, 'level': 1, 'puzzle_score': 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+        if updated_user:
             user_details = {
                 'name': updated_user.get('name', ''),
                 'email': updated_user.get('email', ''),
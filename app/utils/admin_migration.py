@@ -0,0 +1,51 @@
+from pymongo.errors import DuplicateKeyError
+
+# Sessions and upcoming activities used to be pushed onto arrays of the
+# first admin_db document, and tournaments were stored as loose admin_db
+# documents (or in a `tournaments` array). Each now has its own collection.
+# The array fields share their name with the collection they move to.
+EMBEDDED_FIELDS = ('sessions', 'upcoming_activities', 'tournaments')
+
+
+def _copy_items(collection, items):
+    # Upsert on the whole item so that a rerun after an interruption
+    # does not duplicate anything
+    for item in items:
+        if isinstance(item, dict) and item:
+            collection.update_one(item, {'$setOnInsert': item}, upsert=True)
+
+
+def migrate_admin_collection(db):
+    """Move sessions, upcoming activities and tournaments out of admin_db.
+
+    Items are copied before they are removed from admin_db, and only the
+    copied items are pulled, so the migration can be interrupted and run
+    again. Loose tournament documents keep their _id, so existing
+    /tournaments/<id> links still work. Returns the number of items
+    moved per collection.
+    """
+    moved = {field: 0 for field in EMBEDDED_FIELDS}
+
+    for admin in db.admin_db.find({'$or': [{field: {'$exists': True}} for field in EMBEDDED_FIELDS]}):
+        pulls = {}
+        for field in EMBEDDED_FIELDS:
+            items = admin.get(field)
+            if not isinstance(items, list):
+                continue
+            _copy_items(db[field], items)
+            pulls[field] = items
+            moved[field] += len(items)
+        if pulls:
+            db.admin_db.update_one({'_id': admin['_id']}, {'$pullAll': pulls})
+
+    loose = {field: {'$exists': True} for field in ('name', 'type')}
+    for tournament in db.admin_db.find(loose):
+        try:
+            db.tournaments.insert_one(tournament)
+        except DuplicateKeyError:
+            # Copied by an earlier, interrupted run
+            pass
+        db.admin_db.delete_one({'_id': tournament['_id']})
+        moved['tournaments'] += 1
+
+    return moved
@@ -0,0 +1,14 @@
+import hmac
+from flask import request
+
+
+def bearer_matches(secret):
+    """True when the request carries 'Authorization: Bearer <secret>'.
+
+    Always False while `secret` is not configured, so routes guarded by an
+    unset secret stay closed.
+    """
+    if not secret:
+        return False
+    supplied = request.headers.get('Authorization', '').encode()
+    return hmac.compare_digest(supplied, f'Bearer {secret}'.encode())
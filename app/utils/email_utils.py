@@ -1,12 +1,27 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import queue
+import threading
+import time
+from app.config import config
+from app.utils.metrics import smtp_timer
+
+# smtplib and email.mime are imported where they are used, so that cold
+# starts which never send mail do not pay for them.
 
-def send_email(email, session_link, date, time, coach_name):
-    sender_email = "connect@chesschamps.us"
-    sender_password = "iyln tkpp vlpo sjep"  # Use your app-specific password here
-    subject = "Your Chess Session Enrollment"
 
+def build_message(email, subject, body):
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
+    msg = MIMEMultipart()
+    msg['From'] = config.SENDER_EMAIL
+    msg['To'] = email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg.as_string()
+
+
+def session_enrollment_email(session_link, date, time, coach_name):
+    subject = "Your Chess Session Enrollment"
     body = (
         f"Dear Participant,\n\n"
         f"You have successfully enrolled in the chess session.\n\n"
@@ -19,16 +34,143 @@ def send_email(email, session_link, date, time, coach_name):
         f"Best regards,\n"
         f"The Chess Training Team"
     )
+    return subject, body
 
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
 
-    server = smtplib.SMTP('smtp.gmail.com', 587)
-    server.starttls()
-    server.login(sender_email, sender_password)
-    text = msg.as_string()
-    server.sendmail(sender_email, email, text)
-    server.quit()
+def course_registration_email(title):
+    subject = "Course Registration - Action Required"
+    body = f"""
+        Dear Participant,
+
+        Thank you for registering for the course: "{title}".
+
+        To complete your registration, please make a payment of $10 using the following link:
+
+        https://buy.stripe.com/3cs4jw8xYePG6Qg9AA
+
+        After making the payment, please note down the transaction ID as it will be important for confirming your registration.
+
+        If you have any questions or need further assistance, feel free to contact us.
+
+        Best regards,
+        The Course Team
+        """
+    return subject, body
+
+
+def otp_email(otp):
+    return "Your OTP for Sign-In to Kids Learning Portal", f"Your OTP is {otp} "
+
+
+class SMTPConnection:
+    """A reusable, authenticated SMTP session.
+
+    Connects (STARTTLS + login) on first use and keeps the session open for
+    later messages. A session that has been idle longer than SMTP_IDLE_SECONDS
+    or was dropped by the server is transparently re-established.
+    """
+
+    def __init__(self, host=None, port=None):
+        self.host = host or config.SMTP_HOST
+        self.port = port or config.SMTP_PORT
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        import smtplib
+
+        with smtp_timer('connect'):
+            server = smtplib.SMTP(self.host, self.port, timeout=config.SMTP_TIMEOUT_SECONDS)
+            if config.SMTP_STARTTLS:
+                server.starttls()
+            if config.SENDER_PASSWORD:
+                server.login(config.SENDER_EMAIL, config.SENDER_PASSWORD)
+        self._server = server
+
+    def send(self, email, message):
+        import smtplib
+
+        if self._server is not None and time.monotonic() - self._last_used > config.SMTP_IDLE_SECONDS:
+            self.close()
+        if self._server is None:
+            self._connect()
+        try:
+            with smtp_timer('send'):
+                self._server.sendmail(config.SENDER_EMAIL, email, message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the pooled session; retry once on a fresh one
+            self.close()
+            self._connect()
+            with smtp_timer('send'):
+                self._server.sendmail(config.SENDER_EMAIL, email, message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is None:
+            return
+        import smtplib
+
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+        self._server = None
+
+
+def send_bulk(recipients, subject, body, pool_size=None, batch_size=None):
+    """Send one rendered message to many recipients over a pool of SMTP sessions.
+
+    Recipients are split into batches that pool_size worker threads pull
+    from a queue; each worker keeps its own authenticated session for all
+    of its batches. Returns (results, elapsed_seconds) where results holds
+    one {'email', 'status', 'error'} entry per recipient, in input order.
+    """
+    pool_size = pool_size or config.BROADCAST_POOL_SIZE
+    batch_size = batch_size or config.BROADCAST_BATCH_SIZE
+    results = [None] * len(recipients)
+
+    batches = queue.Queue()
+    for start in range(0, len(recipients), batch_size):
+        batches.put(range(start, min(start + batch_size, len(recipients))))
+
+    def worker():
+        import smtplib
+
+        connection = SMTPConnection()
+        try:
+            while True:
+                try:
+                    batch = batches.get_nowait()
+                except queue.Empty:
+                    return
+                for index in batch:
+                    email = recipients[index]
+                    try:
+                        connection.send(email, build_message(email, subject, body))
+                        results[index] = {'email': email, 'status': 'sent', 'error': None}
+                    except Exception as e:
+                        # Anything, not only SMTP errors (a bad address can raise
+                        # UnicodeEncodeError), fails this recipient and not the batch
+                        if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                            connection.close()
+                        results[index] = {'email': email, 'status': 'failed', 'error': str(e)}
+        finally:
+            connection.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(min(pool_size, batches.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def send_email(email, session_link, date, time, coach_name):
+    """Queue the session enrollment email for background delivery."""
+    from app.utils.outbox import enqueue_email
+
+    subject, body = session_enrollment_email(session_link, date, time, coach_name)
+    return enqueue_email(email, subject, body, kind='session_enrollment')
@@ -0,0 +1,157 @@
+import hashlib
+from collections import Counter, defaultdict
+from urllib.parse import quote
+from bson import ObjectId
+from flask import Response, request
+from pymongo.errors import DuplicateKeyError
+from werkzeug.wsgi import FileWrapper
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def grid_out_etag(grid_out):
+    """Strong ETag for a stored GridFS file.
+
+    Files written by older drivers carry an md5; newer drivers no longer
+    compute it, so fall back to the id, upload date and length, which are
+    fixed for the lifetime of the file.
+    """
+    md5 = getattr(grid_out, 'md5', None)
+    if md5:
+        return md5
+    upload_ms = int(grid_out.upload_date.timestamp() * 1000)
+    return f"{grid_out._id}-{upload_ms}-{grid_out.length}"
+
+
+def _content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        return {'filename': filename}
+    except UnicodeEncodeError:
+        return {'filename*': f"UTF-8''{quote(filename, safe='')}"}
+
+
+def send_grid_out(grid_out, max_age=None):
+    """Stream a GridOut to the client chunk by chunk.
+
+    For GET/HEAD requests the response is made conditional, so
+    If-None-Match is answered with 304 and single Range requests with 206
+    (or 416 when unsatisfiable). Only one GridFS chunk is held in memory
+    at a time.
+    """
+    # werkzeug's own wrapper rather than wsgi.file_wrapper: a GridOut has no
+    # real fileno(), which sendfile-based server wrappers expect
+    data = FileWrapper(grid_out, buffer_size=grid_out.chunk_size)
+    response = Response(
+        data,
+        mimetype=grid_out.content_type or 'application/octet-stream',
+        direct_passthrough=True,
+    )
+    response.content_length = grid_out.length
+    response.set_etag(grid_out_etag(grid_out))
+    response.last_modified = grid_out.upload_date
+    if grid_out.filename:
+        response.headers.set('Content-Disposition', 'inline', **_content_disposition(grid_out.filename))
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+
+    return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+
+
+def _sha256_of(stream):
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _acquire_blob(db, sha256):
+    return db.fs.files.find_one_and_update(
+        {'sha256': sha256},
+        {'$inc': {'refcount': 1}},
+        projection={'_id': 1},
+    )
+
+
+def put_deduplicated(db, fs, file):
+    """Store an uploaded file in GridFS, reusing an identical blob if one exists.
+
+    Blobs are addressed by the sha256 of their content and carry a
+    `refcount` of the image set slots pointing at them. Returns
+    (file_id, reused).
+    """
+    sha256 = _sha256_of(file.stream)
+
+    existing = _acquire_blob(db, sha256)
+    if existing:
+        return existing['_id'], True
+
+    file_id = ObjectId()
+    try:
+        fs.put(file.stream, _id=file_id, filename=file.filename, content_type=file.content_type,
+               sha256=sha256, refcount=1)
+    except DuplicateKeyError:
+        # A concurrent upload of the same content got its fs.files document
+        # in first; drop our chunks and share that blob instead
+        db.fs.chunks.delete_many({'files_id': file_id})
+        existing = _acquire_blob(db, sha256)
+        if not existing:
+            raise
+        return existing['_id'], True
+    return file_id, False
+
+
+def release_blob(db, file_id):
+    """Drop one reference to a blob and delete it once nothing points at it.
+
+    Returns False if the file does not exist.
+    """
+    return not release_blobs(db, [file_id])
+
+
+def release_blobs(db, file_ids):
+    """Drop one reference per entry in file_ids, in a fixed number of round trips.
+
+    An id listed twice loses two references. Blobs whose refcount reaches
+    zero are deleted along with their chunks and derivatives. Files stored
+    before deduplication have no refcount and are treated as having a
+    single reference. Returns the ids that do not exist in fs.files.
+    """
+    counts = Counter(file_ids)
+    if not counts:
+        return []
+
+    found = {doc['_id'] for doc in db.fs.files.find({'_id': {'$in': list(counts)}}, {'_id': 1})}
+    missing = [file_id for file_id in counts if file_id not in found]
+
+    by_count = defaultdict(list)
+    for file_id in found:
+        by_count[counts[file_id]].append(file_id)
+    for count, ids in by_count.items():
+        db.fs.files.update_many({'_id': {'$in': ids}}, {'$inc': {'refcount': -count}})
+
+    orphans = list(db.fs.files.find({'_id': {'$in': list(found)}, 'refcount': {'$lte': 0}}, {'variants': 1}))
+    if not orphans:
+        return missing
+
+    orphan_ids = [doc['_id'] for doc in orphans]
+    # Re-check the count in the filter so a blob that an upload re-acquired
+    # in the meantime stays alive, then only drop chunks of what went away
+    db.fs.files.delete_many({'_id': {'$in': orphan_ids}, 'refcount': {'$lte': 0}})
+    survivors = {doc['_id'] for doc in db.fs.files.find({'_id': {'$in': orphan_ids}}, {'_id': 1})}
+
+    doomed = []
+    variant_ids = []
+    for doc in orphans:
+        if doc['_id'] in survivors:
+            continue
+        doomed.append(doc['_id'])
+        # Derivatives (thumbnails, WebP) go together with their original
+        variant_ids.extend(doc.get('variants', {}).values())
+    if variant_ids:
+        db.fs.files.delete_many({'_id': {'$in': variant_ids}})
+    if doomed:
+        db.fs.chunks.delete_many({'files_id': {'$in': doomed + variant_ids}})
+    return missing
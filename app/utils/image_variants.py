@@ -0,0 +1,81 @@
+import os
+from io import BytesIO
+
+# Derivatives rendered for every uploaded puzzle image. All are WebP; the
+# sizes are the longest edge in pixels, None keeps the original dimensions.
+VARIANTS = {
+    'thumb': 160,
+    'medium': 480,
+    'webp': None,
+}
+WEBP_QUALITY = 80
+
+
+def _render(image, max_size):
+    from PIL import Image
+
+    variant = image.copy()
+    if max_size:
+        variant.thumbnail((max_size, max_size), Image.LANCZOS)
+    if variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA' if 'A' in variant.getbands() else 'RGB')
+    buffer = BytesIO()
+    variant.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(db, fs, file_id):
+    """Render the missing VARIANTS of a GridFS original and link them to it.
+
+    Variants are stored as their own GridFS files (with `variant_of`
+    pointing back) and recorded under `variants.<name>` on the original's
+    fs.files document. Returns the names that were generated; an empty
+    list when Pillow is not installed or the file is not a decodable image.
+    """
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return []
+
+    doc = db.fs.files.find_one({'_id': file_id}, {'variants': 1, 'filename': 1})
+    if doc is None:
+        return []
+    existing = doc.get('variants', {})
+    missing = [name for name in VARIANTS if name not in existing]
+    if not missing:
+        return []
+
+    try:
+        with Image.open(fs.get(file_id)) as image:
+            image.load()
+            rendered = {name: _render(image, VARIANTS[name]) for name in missing}
+    except (UnidentifiedImageError, OSError) as e:
+        db.fs.files.update_one({'_id': file_id}, {'$set': {'variants_error': str(e)}})
+        return []
+
+    stem = os.path.splitext(doc.get('filename') or str(file_id))[0]
+    links = {}
+    for name, data in rendered.items():
+        variant_id = fs.put(data, filename=f'{stem}.{name}.webp', content_type='image/webp',
+                            variant_of=file_id, variant=name)
+        links[f'variants.{name}'] = variant_id
+    db.fs.files.update_one({'_id': file_id}, {'$set': links})
+    return list(rendered)
+
+
+def backfill_variants(db, fs, limit=None):
+    """Generate variants for originals uploaded before the pipeline existed.
+
+    Yields (file_id, generated_names) for every original processed.
+    """
+    query = {
+        'variant_of': {'$exists': False},
+        'variants_error': {'$exists': False},
+        'contentType': {'$regex': '^image/'},
+        '$or': [{f'variants.{name}': {'$exists': False}} for name in VARIANTS],
+    }
+    cursor = db.fs.files.find(query, {'_id': 1}).batch_size(100)
+    if limit:
+        cursor = cursor.limit(limit)
+    for doc in cursor:
+        yield doc['_id'], generate_variants(db, fs, doc['_id'])
@@ -0,0 +1,213 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+import bson
+from flask import g, request
+from pymongo import monitoring
+from app.config import config
+
+# Process-local metrics in the Prometheus text format, served by /metrics.
+# Each worker process keeps its own numbers; the scraper adds them up.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {_format_number(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+REQUEST_LABELS = ('blueprint', 'endpoint', 'method')
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, until the response is returned.', REQUEST_LABELS)
+http_requests = Counter(
+    'http_requests_total', 'Requests handled, by status code.', REQUEST_LABELS + ('status',))
+
+MONGO_LABELS = ('collection', 'command')
+mongo_command_duration = Histogram(
+    'mongo_command_duration_seconds', 'Round-trip time of MongoDB commands.', MONGO_LABELS)
+mongo_commands = Counter(
+    'mongo_commands_total', 'MongoDB commands, by outcome.', MONGO_LABELS + ('outcome',))
+mongo_sent_bytes = Counter(
+    'mongo_command_sent_bytes_total', 'BSON size of MongoDB commands sent.', MONGO_LABELS)
+mongo_received_bytes = Counter(
+    'mongo_command_received_bytes_total', 'BSON size of MongoDB replies received.', MONGO_LABELS)
+
+smtp_duration = Histogram(
+    'smtp_operation_duration_seconds', 'Time spent connecting to and sending through SMTP.', ('operation',))
+smtp_operations = Counter(
+    'smtp_operations_total', 'SMTP connects and sends, by outcome.', ('operation', 'outcome'))
+
+REGISTRY = [
+    http_request_duration, http_requests,
+    mongo_command_duration, mongo_commands, mongo_sent_bytes, mongo_received_bytes,
+    smtp_duration, smtp_operations,
+]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _request_labels():
+    if request.url_rule is None:
+        # Unrouted paths share one series so 404 scans cannot blow up cardinality
+        return ('', 'unmatched', request.method)
+    return (request.blueprint or '', request.endpoint or '', request.method)
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        labels = _request_labels()
+        http_request_duration.observe(labels, time.perf_counter() - started)
+        http_requests.inc(labels + (str(response.status_code),))
+    return response
+
+
+def command_collection(event_command, command_name):
+    """The collection a command targets, or '' for database-level commands."""
+    if command_name == 'getMore':
+        target = event_command.get('collection')
+    else:
+        target = event_command.get(command_name)
+    return target if isinstance(target, str) else ''
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts, times and sizes every command sent by the shared client."""
+
+    def __init__(self, measure_bytes=False):
+        self.measure_bytes = measure_bytes
+        self._pending = {}
+
+    def started(self, event):
+        labels = (command_collection(event.command, event.command_name), event.command_name)
+        self._pending[(event.request_id, event.connection_id)] = labels
+        if self.measure_bytes:
+            mongo_sent_bytes.inc(labels, len(bson.encode(event.command)))
+
+    def _finish(self, event, outcome):
+        labels = self._pending.pop((event.request_id, event.connection_id), None)
+        if labels is None:
+            labels = ('', event.command_name)
+        mongo_command_duration.observe(labels, event.duration_micros / 1e6)
+        mongo_commands.inc(labels + (outcome,))
+        return labels
+
+    def succeeded(self, event):
+        labels = self._finish(event, 'success')
+        if self.measure_bytes:
+            mongo_received_bytes.inc(labels, len(bson.encode(event.reply)))
+
+    def failed(self, event):
+        self._finish(event, 'failure')
+
+
+@contextmanager
+def smtp_timer(operation):
+    """Time one SMTP connect or send and count whether it raised."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        smtp_duration.observe((operation,), time.perf_counter() - started)
+        smtp_operations.inc((operation, outcome))
+
+
+_mongo_listener = None
+
+
+def register_mongo_listener():
+    """Attach MongoCommandMetrics to the shared client, once per process.
+
+    Must run before the client is built in init_db.
+    """
+    global _mongo_listener
+    if _mongo_listener is None:
+        from app.database import add_event_listener
+        _mongo_listener = MongoCommandMetrics(measure_bytes=config.METRICS_MONGO_BYTES)
+        add_event_listener(_mongo_listener)
+
+
+def init_metrics(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,213 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app import database
+from app.config import config
+from app.utils.email_utils import SMTPConnection, build_message
+
+# Messages live in the email_outbox collection:
+#   pending -> sending -> sent
+#                      -> pending (retry with backoff) -> ... -> failed
+# While a message is `sending`, next_attempt_at doubles as the lease expiry,
+# so a message claimed by a worker that died is picked up again later.
+
+
+def _outbox():
+    return database.db.email_outbox
+
+
+def _message(email, subject, body, kind, now):
+    return {
+        'to': email,
+        'subject': subject,
+        'body': body,
+        'kind': kind,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    }
+
+
+def _store(email, subject, body, kind):
+    return _outbox().insert_one(_message(email, subject, body, kind, datetime.utcnow())).inserted_id
+
+
+def enqueue_email(email, subject, body, kind=None):
+    """Store a message in the outbox for the worker or the /outbox/drain cron.
+
+    Returns the outbox id; delivery happens later.
+    """
+    message_id = _store(email, subject, body, kind)
+    ensure_worker()
+    _wakeup.set()
+    return message_id
+
+
+def enqueue_many(recipients, subject, body, kind=None):
+    """Queue one message per recipient in a single insert. Returns how many were queued."""
+    now = datetime.utcnow()
+    result = _outbox().insert_many([_message(email, subject, body, kind, now) for email in recipients])
+    ensure_worker()
+    _wakeup.set()
+    return len(result.inserted_ids)
+
+
+def send_through_outbox(email, subject, body, kind=None):
+    """Store a message in the outbox and, with EMAIL_SEND_INLINE, send it now.
+
+    Serverless platforms freeze the process once the response is out, so
+    the send happens during the request over the process's pooled SMTP
+    session. A message that is not sent stays in the outbox for the worker
+    or the /outbox/drain cron. Returns (outbox id, sent).
+    """
+    message_id = _store(email, subject, body, kind)
+    sent = False
+    if config.EMAIL_SEND_INLINE:
+        try:
+            sent = deliver_message(message_id)
+        except PyMongoError as e:
+            print(f"Inline email delivery failed: {e}")
+    if not sent:
+        ensure_worker()
+        _wakeup.set()
+    return message_id, sent
+
+
+def _claim_next(message_id=None):
+    now = datetime.utcnow()
+    query = {'status': {'$in': ['pending', 'sending']}, 'next_attempt_at': {'$lte': now}}
+    if message_id is not None:
+        query['_id'] = message_id
+    return _outbox().find_one_and_update(
+        query,
+        {'$set': {'status': 'sending', 'next_attempt_at': now + timedelta(seconds=config.EMAIL_SEND_LEASE_SECONDS)}},
+        sort=[('next_attempt_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _mark_sent(message):
+    _outbox().update_one(
+        {'_id': message['_id']},
+        {'$set': {'status': 'sent', 'sent_at': datetime.utcnow()}, '$inc': {'attempts': 1}},
+    )
+
+
+def _mark_failed(message, error, permanent=False):
+    attempts = message.get('attempts', 0) + 1
+    update = {'attempts': attempts, 'last_error': str(error)}
+    if permanent or attempts >= config.MAX_RETRIES:
+        update['status'] = 'failed'
+    else:
+        delay = config.RETRY_DELAY_SECONDS * (2 ** (attempts - 1))
+        update['status'] = 'pending'
+        update['next_attempt_at'] = datetime.utcnow() + timedelta(seconds=delay)
+    _outbox().update_one({'_id': message['_id']}, {'$set': update})
+
+
+def _send(connection, message):
+    """Send one claimed message and record the outcome. Returns True if it was sent."""
+    import smtplib
+
+    try:
+        connection.send(message['to'], build_message(message['to'], message['subject'], message['body']))
+    except smtplib.SMTPRecipientsRefused as e:
+        _mark_failed(message, e, permanent=True)
+        return False
+    except (smtplib.SMTPException, OSError) as e:
+        # Drop the session so the next attempt starts from a clean login
+        connection.close()
+        _mark_failed(message, e)
+        return False
+    _mark_sent(message)
+    return True
+
+
+def deliver_pending(connection=None, limit=None):
+    """Send every message that is due over one SMTP session.
+
+    Returns a dict with the number of messages sent and failed.
+    """
+    own_connection = connection is None
+    connection = connection or SMTPConnection()
+    counts = {'sent': 0, 'failed': 0}
+    try:
+        while limit is None or counts['sent'] + counts['failed'] < limit:
+            message = _claim_next()
+            if message is None:
+                break
+            counts['sent' if _send(connection, message) else 'failed'] += 1
+    finally:
+        if own_connection:
+            connection.close()
+    return counts
+
+
+_inline_connection = None
+_inline_pid = None
+_inline_lock = threading.Lock()
+
+
+def deliver_message(message_id):
+    """Send one outbox message now over this process's pooled SMTP session.
+
+    Returns True if it was sent; otherwise it is left for a retry.
+    """
+    global _inline_connection, _inline_pid
+    message = _claim_next(message_id)
+    if message is None:
+        return False
+    with _inline_lock:
+        if _inline_connection is None or _inline_pid != os.getpid():
+            _inline_connection = SMTPConnection()
+            _inline_pid = os.getpid()
+        return _send(_inline_connection, message)
+
+
+class OutboxWorker(threading.Thread):
+    """Daemon thread that drains the outbox over a long-lived SMTP session."""
+
+    def __init__(self):
+        super().__init__(name='email-outbox', daemon=True)
+        self.connection = SMTPConnection()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            _wakeup.clear()
+            try:
+                deliver_pending(self.connection)
+            except PyMongoError as e:
+                print(f"Email outbox worker error: {e}")
+            _wakeup.wait(config.EMAIL_WORKER_POLL_SECONDS)
+        self.connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        _wakeup.set()
+
+
+_wakeup = threading.Event()
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def ensure_worker():
+    """Start the delivery worker for this process if it is enabled and not running.
+
+    Tracks the pid so a forked child starts its own worker instead of
+    assuming the parent's thread is still alive.
+    """
+    global _worker, _worker_pid
+    if not config.EMAIL_WORKER_ENABLED:
+        return None
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _worker = OutboxWorker()
+            _worker_pid = os.getpid()
+            _worker.start()
+        return _worker
@@ -0,0 +1,138 @@
+from pymongo import ReturnDocument, UpdateOne
+from app import database
+
+# Puzzle history lives in `puzzle_progress`, one document per
+# (email, category, title):
+#   {email, category, title, level, puzzles: {Puzzle1: {started, option_guessed, timer, score}, ...}}
+# Users that still carry the legacy users.PuzzleArena tree are migrated the
+# first time their progress is touched, or in bulk by
+# `flask migrate-puzzle-progress`. Users that have an arena are flagged
+# with users.has_puzzle_arena.
+
+NEW_SLOT = {'started': False, 'option_guessed': None, 'timer': 0, 'score': 0}
+
+
+def progress_collection():
+    return database.db.puzzle_progress
+
+
+def _key(email, category, title):
+    return {'email': email, 'category': category, 'title': title}
+
+
+def _fill_missing_puzzles(puzzles):
+    # Pipeline fields that add puzzles without touching ones already stored
+    return {
+        f'puzzles.{puzzle_no}': {'$ifNull': [f'$puzzles.{puzzle_no}', {'$literal': puzzle}]}
+        for puzzle_no, puzzle in puzzles.items()
+    }
+
+
+def migrate_user_document(user):
+    """Copy a user's legacy PuzzleArena into puzzle_progress, then drop it from the user.
+
+    Safe to run while the app is live: puzzles already present in
+    puzzle_progress were written after the cut-over and win over the
+    legacy copy, and the bulk write is idempotent.
+    """
+    operations = []
+    for category, titles in (user.get('PuzzleArena') or {}).items():
+        for title, puzzles in (titles or {}).items():
+            fields = {
+                'email': user['email'],
+                'category': category,
+                'title': title,
+                'level': {'$ifNull': ['$level', {'$literal': user.get('level')}]},
+            }
+            fields.update(_fill_missing_puzzles(puzzles or {}))
+            operations.append(UpdateOne(_key(user['email'], category, title), [{'$set': fields}], upsert=True))
+    if operations:
+        progress_collection().bulk_write(operations, ordered=False)
+    database.users_collection.update_one(
+        {'_id': user['_id']},
+        {'$unset': {'PuzzleArena': ''}, '$set': {'has_puzzle_arena': True}}
+    )
+    return len(operations)
+
+
+def migrate_legacy(email):
+    """Migrate one user if they still have a legacy PuzzleArena. Returns True if they did."""
+    user = database.users_collection.find_one(
+        {'email': email, 'PuzzleArena': {'$exists': True}},
+        {'email': 1, 'level': 1, 'PuzzleArena': 1}
+    )
+    if user is None:
+        return False
+    migrate_user_document(user)
+    return True
+
+
+def migrate_all(batch_size=100):
+    """Migrate every user that still has a legacy PuzzleArena. Yields (email, titles moved)."""
+    cursor = database.users_collection.find(
+        {'PuzzleArena': {'$exists': True}},
+        {'email': 1, 'level': 1, 'PuzzleArena': 1}
+    ).batch_size(batch_size)
+    for user in cursor:
+        yield user.get('email'), migrate_user_document(user)
+
+
+def find_title(email, category, title, projection=None):
+    """The progress document of one title, migrating legacy data on a miss."""
+    projection = projection or {'puzzles': 1}
+    doc = progress_collection().find_one(_key(email, category, title), projection)
+    if doc is None and migrate_legacy(email):
+        doc = progress_collection().find_one(_key(email, category, title), projection)
+    return doc
+
+
+def ensure_title(email, category, title, level, puzzle_count):
+    """Create Puzzle1..puzzle_count for a title, keeping puzzles that already exist.
+
+    Returns the title's puzzles after the write.
+    """
+    fields = {'level': {'$ifNull': ['$level', {'$literal': level}]}}
+    fields.update(_fill_missing_puzzles({f'Puzzle{i}': NEW_SLOT for i in range(1, puzzle_count + 1)}))
+    doc = progress_collection().find_one_and_update(
+        _key(email, category, title),
+        [{'$set': fields}],
+        projection={'_id': 0, 'puzzles': 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc['puzzles']
+
+
+def record_answer(email, category, title, puzzle_no, score, option_guessed, timer, session=None):
+    """Apply one answer atomically and return the stored document as it was before.
+
+    Returns None when the title does not exist or the puzzle is already
+    solved (score 1, which is never changed). Otherwise the result holds
+    `level` and this puzzle under `puzzles`. A previous wrong guess
+    (option_guessed False) forces score 0; the timer is always recorded.
+    """
+    puzzle_path = f'puzzles.{puzzle_no}'
+    puzzle_fields = {
+        'started': True,
+        'timer': {'$literal': timer},
+        'score': {'$cond': [
+            {'$eq': [f'${puzzle_path}.option_guessed', False]},
+            0,
+            {'$literal': score} if score is not None else f'${puzzle_path}.score'
+        ]},
+    }
+    if option_guessed is not None:
+        puzzle_fields['option_guessed'] = {'$literal': option_guessed}
+
+    query = _key(email, category, title)
+    query[f'{puzzle_path}.score'] = {'$ne': 1}
+    return progress_collection().find_one_and_update(
+        query,
+        [{'$set': {puzzle_path: {'$mergeObjects': [f'${puzzle_path}', puzzle_fields]}}}],
+        projection={'_id': 0, 'level': 1, puzzle_path: 1},
+        session=session
+    )
+
+
+def title_exists(email, category, title):
+    return progress_collection().find_one(_key(email, category, title), {'_id': 1}) is not None
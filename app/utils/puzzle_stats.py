@@ -0,0 +1,124 @@
+import re
+import threading
+from app.config import config
+from app.utils.cache import LRUCache
+
+# (category, title, level or None) -> {puzzle_no: totals}. Totals are sums,
+# so an attempt landing on this worker is folded in without a recompute;
+# the TTL bounds how far attempts handled by other workers can lag.
+stats_cache = LRUCache(maxsize=config.PUZZLE_STATS_CACHE_SIZE, ttl=config.PUZZLE_STATS_CACHE_TTL)
+_update_lock = threading.Lock()
+# key -> token of the fill currently computing it. An attempt on a key
+# that is not cached yet drops the token, because the aggregate may have
+# run before the attempt was written; that fill is then not cached.
+_fills = {}
+
+
+def _contribution(puzzle):
+    if not puzzle or not puzzle.get('started'):
+        return None
+    timer = puzzle.get('timer') or 0
+    return {
+        'attempts': 1,
+        'solved': 1 if puzzle.get('score') == 1 else 0,
+        'wrong': 1 if puzzle.get('option_guessed') is False else 0,
+        'timer_total': timer if isinstance(timer, (int, float)) else 0,
+    }
+
+
+def compute_stats(progress_collection, category, title, level=None):
+    """Aggregate attempts, solves, wrong guesses and time per puzzle inside MongoDB.
+
+    A puzzle counts as attempted once `started` is set; it is solved when
+    its score is 1.
+    """
+    match = {'category': category, 'title': title}
+    if level:
+        match['level'] = level
+    pipeline = [
+        {'$match': match},
+        {'$project': {'_id': 0, 'puzzle': {'$objectToArray': '$puzzles'}}},
+        {'$unwind': '$puzzle'},
+        {'$match': {'puzzle.v.started': True}},
+        {'$group': {
+            '_id': '$puzzle.k',
+            'attempts': {'$sum': 1},
+            'solved': {'$sum': {'$cond': [{'$eq': ['$puzzle.v.score', 1]}, 1, 0]}},
+            'wrong': {'$sum': {'$cond': [{'$eq': ['$puzzle.v.option_guessed', False]}, 1, 0]}},
+            'timer_total': {'$sum': {'$ifNull': ['$puzzle.v.timer', 0]}},
+        }},
+    ]
+    return {
+        row['_id']: {key: row[key] for key in ('attempts', 'solved', 'wrong', 'timer_total')}
+        for row in progress_collection.aggregate(pipeline)
+    }
+
+
+def get_stats(progress_collection, category, title, level=None):
+    key = (category, title, level or None)
+    totals = stats_cache.get(key)
+    if totals is None:
+        generation = stats_cache.generation()
+        token = object()
+        with _update_lock:
+            _fills[key] = token
+        totals = compute_stats(progress_collection, category, title, level)
+        with _update_lock:
+            if _fills.get(key) is token:
+                del _fills[key]
+                stats_cache.set(key, totals, generation)
+    with _update_lock:
+        return summarize(totals)
+
+
+def _puzzle_order(puzzle_no):
+    match = re.search(r'(\d+)$', puzzle_no)
+    return (int(match.group(1)) if match else float('inf'), puzzle_no)
+
+
+def summarize(totals):
+    puzzles = []
+    for puzzle_no in sorted(totals, key=_puzzle_order):
+        row = totals[puzzle_no]
+        attempts = row['attempts']
+        puzzles.append({
+            'puzzle_no': puzzle_no,
+            'attempts': attempts,
+            'solved': row['solved'],
+            'wrong': row['wrong'],
+            'solve_rate': round(row['solved'] / attempts, 4) if attempts else 0.0,
+            'avg_timer': round(row['timer_total'] / attempts, 2) if attempts else 0.0,
+        })
+    return puzzles
+
+
+def apply_attempt(before, score, option_guessed, timer):
+    """The puzzle state /update_puzzle_started writes, given the stored `before`."""
+    after = dict(before or {})
+    after['started'] = True
+    after['timer'] = timer
+    if after.get('option_guessed') is False:
+        after['score'] = 0
+    elif score is not None:
+        after['score'] = score
+    if option_guessed is not None:
+        after['option_guessed'] = option_guessed
+    return after
+
+
+def record_attempt(category, title, level, puzzle_no, before, after):
+    """Fold one puzzle's change from `before` to `after` into the cached totals."""
+    old, new = _contribution(before), _contribution(after)
+    if old == new:
+        return
+    for key in {(category, title, None), (category, title, level or None)}:
+        with _update_lock:
+            totals = stats_cache.peek(key)
+            if totals is None:
+                _fills.pop(key, None)
+                continue
+            row = totals.setdefault(puzzle_no, {'attempts': 0, 'solved': 0, 'wrong': 0, 'timer_total': 0})
+            for field in row:
+                row[field] += (new or {}).get(field, 0) - (old or {}).get(field, 0)
+            if row['attempts'] <= 0:
+                del totals[puzzle_no]
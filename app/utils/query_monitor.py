@@ -0,0 +1,203 @@
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from flask import has_request_context, request
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from app.config import config
+from app.indexes import plan_has_collscan
+
+# Commands whose filter can be explained as a find, and where the filter
+# (and sort) live in each of them
+MONITORED_COMMANDS = ('find', 'update', 'delete', 'findAndModify', 'aggregate', 'count', 'distinct')
+
+
+def _filter_and_sort(command_name, command):
+    if command_name == 'find':
+        return command.get('filter') or {}, command.get('sort')
+    if command_name == 'update':
+        updates = command.get('updates') or [{}]
+        return updates[0].get('q') or {}, None
+    if command_name == 'delete':
+        deletes = command.get('deletes') or [{}]
+        return deletes[0].get('q') or {}, None
+    if command_name == 'findAndModify':
+        return command.get('query') or {}, command.get('sort')
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+        first = pipeline[0] if pipeline else {}
+        return first.get('$match', {}), None
+    return command.get('query') or {}, None
+
+
+# Path segments that carry data rather than schema: array positions
+# ("answers.3") and numbered keys ("puzzles.Puzzle12.score")
+_DYNAMIC_SEGMENT = re.compile(r'^([A-Za-z_]*?)\d+$')
+
+
+def _shape_key(key):
+    if not isinstance(key, str) or key.startswith('$'):
+        return key
+    return '.'.join(_DYNAMIC_SEGMENT.sub(r'\1<n>', segment) for segment in key.split('.'))
+
+
+def query_shape(value):
+    """The filter with every literal replaced by 1, so equal-shaped queries group together.
+
+    Numbered path segments are folded too, so puzzles.Puzzle1.score and
+    puzzles.Puzzle2.score are one shape.
+    """
+    if isinstance(value, dict):
+        return {_shape_key(key): query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(item) for item in value[:1]]
+    return 1
+
+
+class SlowQueryMonitor(monitoring.CommandListener):
+    """Samples slow finds and updates, explains their filters off-thread and reports COLLSCANs.
+
+    Commands slower than SLOW_QUERY_THRESHOLD_MS are sampled at
+    SLOW_QUERY_SAMPLE_RATE. Each query shape is explained at most once
+    per SLOW_QUERY_EXPLAIN_INTERVAL seconds, on a background thread so
+    requests never wait for it. Findings are kept per shape together with
+    the Flask endpoints that issued it, for the SLOW_QUERY_MAX_SHAPES most
+    recently seen shapes, and every COLLSCAN is logged.
+    """
+
+    def __init__(self, threshold_ms, sample_rate, explain_interval, max_shapes=500):
+        self.threshold_micros = threshold_ms * 1000
+        self.sample_rate = sample_rate
+        self.explain_interval = explain_interval
+        self.max_shapes = max_shapes
+        self._pending = {}
+        # Least recently seen shape first; the oldest is dropped past max_shapes
+        self._findings = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+        self._worker_pid = None
+
+    def started(self, event):
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            return
+        query_filter, sort = _filter_and_sort(event.command_name, event.command)
+        endpoint = request.endpoint if has_request_context() else None
+        self._pending[(event.request_id, event.connection_id)] = (
+            event.database_name, collection, query_filter, sort, endpoint or 'background'
+        )
+
+    def succeeded(self, event):
+        sample = self._pending.pop((event.request_id, event.connection_id), None)
+        if sample is None or event.duration_micros < self.threshold_micros:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self._record(event.command_name, sample, event.duration_micros / 1000)
+
+    def failed(self, event):
+        self._pending.pop((event.request_id, event.connection_id), None)
+
+    def _record(self, command_name, sample, duration_ms):
+        database_name, collection, query_filter, sort, endpoint = sample
+        shape = json.dumps(query_shape(query_filter), sort_keys=True, default=str)
+        key = (collection, command_name, shape)
+        now = time.time()
+        with self._lock:
+            finding = self._findings.get(key)
+            if finding is None:
+                finding = self._findings[key] = {
+                    'collection': collection,
+                    'command': command_name,
+                    'shape': shape,
+                    'count': 0,
+                    'max_ms': 0.0,
+                    'endpoints': {},
+                    'collscan': None,
+                    'explained_at': 0,
+                }
+                if len(self._findings) > self.max_shapes:
+                    self._findings.popitem(last=False)
+            else:
+                self._findings.move_to_end(key)
+            finding['count'] += 1
+            finding['max_ms'] = max(finding['max_ms'], round(duration_ms, 1))
+            finding['endpoints'][endpoint] = finding['endpoints'].get(endpoint, 0) + 1
+            due = now - finding['explained_at'] >= self.explain_interval
+            if due:
+                finding['explained_at'] = now
+        if due:
+            try:
+                self._queue.put_nowait((key, database_name, collection, query_filter, sort, endpoint, duration_ms))
+                self._ensure_worker()
+            except queue.Full:
+                pass
+
+    def _ensure_worker(self):
+        # A worker thread does not survive fork(); start one per process
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._explain_loop, name='slow-query-explain', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _explain_loop(self):
+        from app.database import get_client
+
+        while True:
+            key, database_name, collection, query_filter, sort, endpoint, duration_ms = self._queue.get()
+            find = {'find': collection, 'filter': query_filter}
+            if sort:
+                find['sort'] = sort
+            try:
+                explained = get_client()[database_name].command({'explain': find, 'verbosity': 'queryPlanner'})
+            except PyMongoError as e:
+                print(f"Slow query explain failed for {collection}: {e}")
+                continue
+            collscan = plan_has_collscan(explained.get('queryPlanner', {}).get('winningPlan', {}))
+            with self._lock:
+                finding = self._findings.get(key)
+                if finding is not None:
+                    finding['collscan'] = collscan
+            if collscan:
+                print(f"COLLSCAN {collection}.{key[1]} from {endpoint} ({duration_ms:.0f} ms): {key[2]}")
+
+    def findings(self):
+        """Every slow query shape seen so far, collection scans and most frequent first."""
+        with self._lock:
+            rows = [dict(finding, endpoints=dict(finding['endpoints'])) for finding in self._findings.values()]
+        for row in rows:
+            row.pop('explained_at')
+        return sorted(rows, key=lambda row: (not row['collscan'], -row['count']))
+
+
+monitor = None
+
+
+def register_query_monitor():
+    """Attach the SlowQueryMonitor to the shared client, once per process.
+
+    Must run before the client is built in init_db.
+    """
+    global monitor
+    if monitor is None:
+        from app.database import add_event_listener
+        monitor = SlowQueryMonitor(
+            threshold_ms=config.SLOW_QUERY_THRESHOLD_MS,
+            sample_rate=config.SLOW_QUERY_SAMPLE_RATE,
+            explain_interval=config.SLOW_QUERY_EXPLAIN_INTERVAL,
+            max_shapes=config.SLOW_QUERY_MAX_SHAPES,
+        )
+        add_event_listener(monitor)
+    return monitor
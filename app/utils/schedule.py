@@ -0,0 +1,102 @@
+from zoneinfo import ZoneInfo
+from flask import request
+from app.config import config
+from time_utils import parse_datetime
+
+MAX_LIMIT = 500
+
+
+def parse_start(date, time=None, strict=False):
+    """parse_datetime with the configured DATE_ORDER and CLUB_TIMEZONE.
+
+    `strict` ignores DATE_ORDER and rejects numeric dates that read
+    differently day-first and month-first, for stored data whose order is
+    not known.
+    """
+    day_first = None if strict else {'DMY': True, 'MDY': False}.get(config.DATE_ORDER)
+    return parse_datetime(date, time, day_first=day_first, tz=ZoneInfo(config.CLUB_TIMEZONE))
+
+
+def starts_at_of(doc, strict=False):
+    """The typed start of a session, activity or tournament from its date/time strings."""
+    return parse_start(doc.get('date'), doc.get('time'), strict=strict)
+
+
+def start_queries(date, time):
+    """Filters that find a record by its date and time, most precise first.
+
+    The typed starts_at comes first. The stored strings follow, for legacy
+    records that backfill-starts-at could not parse and that have no
+    starts_at, or for input this parser cannot read.
+    """
+    queries = []
+    starts_at = parse_start(date, time)
+    if starts_at is not None:
+        queries.append({'starts_at': starts_at})
+    queries.append({'date': date, 'time': time})
+    return queries
+
+
+def window_query():
+    """Build the filter and limit for ?from=&to=&limit= on a listing endpoint.
+
+    `from` is inclusive and `to` exclusive; both accept the same formats
+    as stored dates. Without `limit` the whole window is returned (0 is
+    "no limit" to pymongo). Raises ValueError with a message for the client.
+    """
+    query = {}
+    bounds = {}
+    for param, operator in (('from', '$gte'), ('to', '$lt')):
+        value = request.args.get(param)
+        if value is None:
+            continue
+        parsed = parse_start(value)
+        if parsed is None:
+            raise ValueError(f"'{param}' must be a date or ISO 8601 timestamp")
+        bounds[operator] = parsed
+    if bounds:
+        query['starts_at'] = bounds
+
+    if request.args.get('limit') is None:
+        return query, 0
+    try:
+        limit = int(request.args['limit'])
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if limit < 1:
+        raise ValueError("'limit' must be positive")
+    return query, min(limit, MAX_LIMIT)
+
+
+def serialize(doc):
+    doc['_id'] = str(doc['_id'])
+    if doc.get('starts_at'):
+        doc['starts_at'] = doc['starts_at'].isoformat()
+    return doc
+
+
+def backfill_starts_at(collection, batch_size=500, recompute=False):
+    """Set starts_at on documents written before it existed.
+
+    With `recompute` every document is parsed again, e.g. after
+    CLUB_TIMEZONE changed.
+
+    Returns (updated, unparseable ids) so that records with dates the
+    parser does not understand, or that read differently day-first and
+    month-first, can be fixed by hand. Legacy records are parsed strictly:
+    DATE_ORDER describes what the admin UI sends now, not what it stored.
+    """
+    updated = 0
+    unparseable = []
+    cursor = collection.find(
+        {} if recompute else {'starts_at': {'$exists': False}},
+        {'date': 1, 'time': 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        starts_at = starts_at_of(doc, strict=True)
+        if starts_at is None:
+            unparseable.append(doc['_id'])
+            continue
+        collection.update_one({'_id': doc['_id']}, {'$set': {'starts_at': starts_at}})
+        updated += 1
+    return updated, unparseable
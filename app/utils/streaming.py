@@ -0,0 +1,42 @@
+import json
+from datetime import date, datetime
+from bson import ObjectId
+from flask import Response, request, stream_with_context
+from app.config import config
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """True when the client asked for NDJSON (Accept: application/x-ndjson) over JSON."""
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def _encode(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def ndjson_response(cursor, transform=None):
+    """Stream a Mongo cursor as newline-delimited JSON, one document per line.
+
+    Documents are encoded as they come off the cursor, which fetches
+    NDJSON_BATCH_SIZE documents per round trip, so memory stays flat no
+    matter how large the collection is.
+    """
+    cursor = cursor.batch_size(config.NDJSON_BATCH_SIZE)
+
+    def generate():
+        try:
+            for document in cursor:
+                if transform:
+                    document = transform(document)
+                yield json.dumps(document, default=_encode) + '\n'
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
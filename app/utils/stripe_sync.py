@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import time
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from app.config import config
+
+# Checkout sessions can be completed up to 24 hours after they are created,
+# so every incremental sync re-reads that window behind the high-water mark.
+SYNC_OVERLAP_SECONDS = 24 * 3600
+PAGE_SIZE = 100
+
+
+class StripeSyncError(Exception):
+    pass
+
+
+def payment_from_session(session):
+    """Map a Stripe Checkout Session to a `payments` document, or None without an email."""
+    customer = session.get('customer_details') or {}
+    email = customer.get('email')
+    if not email:
+        return None
+    return {
+        '_id': session['id'],
+        'email': email.strip().lower(),
+        'status': session.get('status'),
+        'payment_status': session.get('payment_status'),
+        'amount_total': session.get('amount_total'),
+        'currency': session.get('currency'),
+        'created': session.get('created'),
+        'payment_link': session.get('payment_link'),
+    }
+
+
+def upsert_payment(db, payment):
+    payment = dict(payment, synced_at=datetime.utcnow())
+    db.payments.update_one({'_id': payment['_id']}, {'$set': payment}, upsert=True)
+
+
+def _list_sessions(params):
+    # Imported here: only a /check-email miss or a sync ever talks to Stripe
+    import requests
+
+    response = requests.get(
+        f"{config.STRIPE_API_BASE}/v1/checkout/sessions",
+        params=params,
+        auth=(config.STRIPE_SECRET_KEY, ''),
+        timeout=config.STRIPE_TIMEOUT_SECONDS,
+    )
+    if response.status_code != 200:
+        raise StripeSyncError(f"Stripe returned {response.status_code}: {response.text[:200]}")
+    return response.json()
+
+
+def sync_payments(db, full=False):
+    """Pull new Checkout Sessions for PAYMENT_LINK into the `payments` collection.
+
+    Pages through the Stripe list with a `starting_after` cursor, starting
+    from the last synced `created` timestamp (minus SYNC_OVERLAP_SECONDS)
+    unless `full` is set. The high-water mark only moves once every page
+    has been stored, so an interrupted sync is simply repeated. Returns
+    the number of sessions stored.
+    """
+    if not config.PAYMENT_LINK:
+        raise StripeSyncError('PAYMENT_LINK is not configured')
+
+    state = db.meta.find_one({'_id': 'stripe_sync'}) or {}
+    since = 0 if full else max(state.get('last_created', 0) - SYNC_OVERLAP_SECONDS, 0)
+
+    params = {'payment_link': config.PAYMENT_LINK, 'limit': PAGE_SIZE, 'created[gte]': since}
+    newest = state.get('last_created', 0)
+    stored = 0
+    while True:
+        page = _list_sessions(params)
+        sessions = page.get('data', [])
+        for session in sessions:
+            newest = max(newest, session.get('created') or 0)
+            payment = payment_from_session(session)
+            if payment:
+                upsert_payment(db, payment)
+                stored += 1
+        if not page.get('has_more') or not sessions:
+            break
+        params['starting_after'] = sessions[-1]['id']
+
+    db.meta.update_one(
+        {'_id': 'stripe_sync'},
+        {'$set': {'last_created': newest, 'synced_at': time.time()}},
+        upsert=True,
+    )
+    return stored
+
+
+def sync_if_stale(db):
+    """Run an incremental sync unless one was started in the last PAYMENT_SYNC_MIN_INTERVAL seconds.
+
+    The slot is claimed atomically on the sync state document, so a burst
+    of concurrent /check-email misses triggers a single Stripe sync.
+    Returns True if this call ran the sync.
+    """
+    now = time.time()
+    try:
+        result = db.meta.update_one(
+            {'_id': 'stripe_sync', '$or': [
+                {'claimed_at': {'$exists': False}},
+                {'claimed_at': {'$lt': now - config.PAYMENT_SYNC_MIN_INTERVAL}},
+            ]},
+            {'$set': {'claimed_at': now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The state document exists but was claimed recently
+        return False
+    if not (result.modified_count or result.upserted_id):
+        return False
+    sync_payments(db)
+    return True
+
+
+def verify_signature(payload, header, secret, tolerance=300):
+    """Check a `Stripe-Signature` header against the raw request body.
+
+    Stripe signs "<timestamp>.<payload>" with HMAC-SHA256 and sends the
+    timestamp as `t` and one or more signatures as `v1`. Events older than
+    `tolerance` seconds are rejected to stop replays.
+    """
+    if not header or not secret:
+        return False
+    timestamp = None
+    signatures = []
+    for item in header.split(','):
+        key, _, value = item.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    if not timestamp or not signatures:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+
+    signed = timestamp.encode() + b'.' + payload
+    expected = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return any(hmac.compare_digest(expected, signature) for signature in signatures)
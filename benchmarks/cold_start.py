@@ -0,0 +1,101 @@
+"""Cold and warm start cost of create_app() against a real MongoDB.
+
+Cold starts run in fresh interpreters, the way a Vercel instance boots:
+import run.py, then issue the first query. Warm invocations call
+create_app() again inside one process, which is what a reused serverless
+instance does; they compare the shared client from app/database.py with
+building a default MongoClient per invocation, as init_db used to.
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/cold_start.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = r'''
+import json, time
+started = time.perf_counter()
+from run import app
+created = time.perf_counter()
+from app import database
+database.db.command('ping')
+pinged = time.perf_counter()
+print(json.dumps({'create_app': created - started, 'first_query': pinged - created, 'total': pinged - started}))
+'''
+
+
+def cold_starts(runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+            env=dict(os.environ, ENSURE_INDEXES='false', EMAIL_WORKER_ENABLED='false'),
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def warm_invocations(runs):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('ENSURE_INDEXES', 'false')
+    os.environ.setdefault('EMAIL_WORKER_ENABLED', 'false')
+    from pymongo import MongoClient
+    from app import create_app, database
+    from app.config import config
+
+    shared, per_invocation = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        create_app()
+        database.db.command('ping')
+        shared.append(time.perf_counter() - started)
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        client = MongoClient(config.MONGO_URI)
+        client[config.MONGO_DB_NAME].command('ping')
+        per_invocation.append(time.perf_counter() - started)
+        client.close()
+    return shared, per_invocation
+
+
+def summarize(samples):
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 2),
+        'min_ms': round(min(samples) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    if not os.getenv('MONGO_URI'):
+        parser.error('MONGO_URI must point at a MongoDB to benchmark against')
+
+    cold = cold_starts(args.runs)
+    shared, per_invocation = warm_invocations(args.runs)
+    results = {
+        'runs': args.runs,
+        'cold_start': {key: summarize([sample[key] for sample in cold]) for key in ('create_app', 'first_query', 'total')},
+        'warm_shared_client': summarize(shared),
+        'warm_new_client': summarize(per_invocation),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
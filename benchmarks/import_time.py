@@ -0,0 +1,87 @@
+"""Import-time budget for a cold start of run.py.
+
+Runs `python -X importtime -c "import run"` in a fresh interpreter with
+start-up side effects (index reconciliation, outbox worker) switched off,
+then prints the slowest modules by cumulative import time. Exits non-zero
+when the total goes over the budget, or when a module that is meant to
+be imported lazily shows up at start-up.
+
+    python benchmarks/import_time.py --budget-ms 400
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the request paths that need these should import them
+DEFERRED_MODULES = ['requests', 'smtplib', 'email.mime.multipart', 'gridfs', 'PIL']
+
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile(runs):
+    """Cumulative import time per module (microseconds), best of `runs`."""
+    best = None
+    for _ in range(runs):
+        env = dict(os.environ, ENSURE_INDEXES='false', EMAIL_WORKER_ENABLED='false', PYTHONDONTWRITEBYTECODE='1')
+        stderr = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import run'],
+            cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+        ).stderr
+        modules = {}
+        total = 0
+        for line in stderr.splitlines():
+            match = LINE.match(line)
+            if not match:
+                continue
+            # CPython indents nested imports by two spaces per level after "| "
+            level = (len(match.group(3)) - 1) // 2
+            cumulative, name = int(match.group(2)), match.group(4)
+            modules[name] = cumulative
+            if level == 0:
+                # Top-level imports (interpreter start-up plus `import run`);
+                # their cumulative times add up to the whole import cost
+                total += cumulative
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', '400')))
+    parser.add_argument('--runs', type=int, default=3, help='Profile this many times and keep the fastest.')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    total, modules = profile(args.runs)
+    total_ms = total / 1000
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    eager = [name for name in DEFERRED_MODULES if name in modules]
+
+    print(f"Start-up imports: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    for name in eager:
+        print(f"EAGER  {name} is imported at start-up")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({
+                'total_ms': round(total_ms, 1),
+                'budget_ms': args.budget_ms,
+                'slowest': [{'module': name, 'ms': round(cumulative / 1000, 1)} for name, cumulative in slowest],
+                'eager_deferred_modules': eager,
+            }, handle, indent=2)
+
+    if total_ms > args.budget_ms or eager:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""Offline load test for the hot endpoints.
+
+Starts create_app() against a local MongoDB (an existing MONGO_URI, or a
+throwaway mongod started with --mongod), with email going to an in-process
+SMTP sink and Stripe calls going to an in-process stub. It seeds users
+with puzzle progress and image sets backed by real GridFS files, replays
+a weighted mix of requests from several threads through the Flask test
+client, and reports p50/p95/p99 latency and requests per second per
+endpoint.
+
+    python benchmarks/load_test.py --mongod mongod --users 5000 --duration 30 \\
+        --output results.json
+    python benchmarks/load_test.py --mongod mongod --compare results.json
+
+Results are written as JSON; --compare prints the change against an
+earlier run and exits non-zero when an endpoint's p95 regressed by more
+than --max-regression percent.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ["Opening", "Middlegame", "Endgame", "Mixed"]
+LEVELS = ['beginner', 'intermediate', 'advanced']
+
+# endpoint -> relative weight in the replayed traffic
+TRAFFIC_MIX = {
+    'login': 15,
+    'update_puzzle_started': 30,
+    'imagesets': 10,
+    'get_level': 15,
+    'image_get_fileid': 20,
+    'calculate_scores': 10,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# --- Local services -------------------------------------------------------
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every message and counts it."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 loadtest sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 Queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # EHLO, HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port):
+        super().__init__(('127.0.0.1', port), SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """Answers the Checkout Session list with an empty page."""
+
+    def do_GET(self):
+        body = json.dumps({'object': 'list', 'data': [], 'has_more': False}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_in_background(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def start_mongod(binary):
+    dbpath = tempfile.mkdtemp(prefix='loadtest-mongod-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    port = free_port()
+    process = subprocess.Popen(
+        [binary, '--dbpath', dbpath, '--port', str(port), '--bind_ip', '127.0.0.1', '--quiet'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, dbpath, f'mongodb://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('mongod did not start within 30 seconds')
+
+
+# --- Seed data ------------------------------------------------------------
+
+def png_bytes(rng, size):
+    """A valid grayscale PNG of `size` x `size` noise pixels."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = b''.join(b'\x00' + bytes(rng.getrandbits(8) for _ in range(size)) for _ in range(size))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows))
+            + chunk(b'IEND', b''))
+
+
+def puzzle_state(rng):
+    if rng.random() < 0.5:
+        return {'started': False, 'option_guessed': None, 'timer': 0, 'score': 0}
+    return {
+        'started': True,
+        'option_guessed': rng.random() > 0.3,
+        'timer': rng.randint(5, 300),
+        'score': 1 if rng.random() > 0.4 else 0,
+    }
+
+
+def seed(db, fs, args, rng):
+    """Users with puzzle progress, and image sets whose puzzles are GridFS files."""
+    titles = [f'Set {n}' for n in range(args.titles)]
+    file_ids = []
+    image_sets = []
+    for level in LEVELS:
+        for category in CATEGORIES:
+            for title in titles:
+                puzzles = {}
+                for n in range(1, args.puzzles + 1):
+                    data = png_bytes(rng, args.image_size)
+                    file_id = fs.put(data, filename=f'{title}-{n}.png', content_type='image/png',
+                                     sha256=hashlib.sha256(data).hexdigest(), refcount=1)
+                    file_ids.append(str(file_id))
+                    puzzles[f'puzzle{n}'] = {'id': str(file_id), 'move': 'Black to Move', 'solution': None, 'sid_link': None}
+                image_sets.append({
+                    'title': title, 'level': level, 'category': category, 'live': 'false',
+                    'live_link': '', 'date_time': '2024-01-01T10:00', 'file_ids': puzzles,
+                })
+    db.image_sets.insert_many(image_sets)
+
+    users = []
+    progress = []
+    for n in range(args.users):
+        email = f'student{n}@loadtest.local'
+        level = LEVELS[n % len(LEVELS)]
+        arena = {}
+        for category in CATEGORIES:
+            arena[category] = {}
+            for title in titles[:args.titles_per_user or len(titles)]:
+                arena[category][title] = {f'Puzzle{p}': puzzle_state(rng) for p in range(1, args.puzzles + 1)}
+        user = {'email': email, 'name': f'Student {n}', 'level': level,
+                'contactNumber': f'555{n:07d}', 'puzzle_score': rng.randint(0, 500)}
+        if args.layout == 'legacy':
+            user['PuzzleArena'] = arena
+        else:
+            user['has_puzzle_arena'] = True
+            for category, category_titles in arena.items():
+                for title, puzzles in category_titles.items():
+                    progress.append({'email': email, 'category': category, 'title': title,
+                                     'level': level, 'puzzles': puzzles})
+        users.append(user)
+        if len(users) >= 1000:
+            db.users.insert_many(users)
+            users = []
+    if users:
+        db.users.insert_many(users)
+    for start in range(0, len(progress), 5000):
+        db.puzzle_progress.insert_many(progress[start:start + 5000])
+    return titles, file_ids
+
+
+# --- Traffic --------------------------------------------------------------
+
+def make_request(client, endpoint, rng, args, titles, file_ids):
+    user = rng.randrange(args.users)
+    email = f'student{user}@loadtest.local'
+    level = LEVELS[user % len(LEVELS)]
+    if endpoint == 'login':
+        return client.post('/login', json={'email': email, 'device_name': 'loadtest'})
+    if endpoint == 'update_puzzle_started':
+        return client.post('/update_puzzle_started', json={
+            'email': email, 'category': rng.choice(CATEGORIES), 'title': rng.choice(titles),
+            'puzzle_no': f'Puzzle{rng.randint(1, args.puzzles)}', 'score': rng.choice([0, 1]),
+            'option_guessed': rng.choice([True, False, None]), 'timer': rng.randint(5, 300),
+        })
+    if endpoint == 'imagesets':
+        return client.get('/imagesets')
+    if endpoint == 'get_level':
+        return client.get('/get_level', query_string={'level': level})
+    if endpoint == 'image_get_fileid':
+        return client.get(f'/image_get_fileid/{rng.choice(file_ids)}')
+    if endpoint == 'calculate_scores':
+        return client.post('/calculate_scores', json={'email': email})
+    raise ValueError(endpoint)
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+def replay(app, args, titles, file_ids):
+    endpoints = list(TRAFFIC_MIX)
+    weights = [TRAFFIC_MIX[endpoint] for endpoint in endpoints]
+    samples = {endpoint: [] for endpoint in endpoints}
+    errors = {endpoint: 0 for endpoint in endpoints}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        client = app.test_client()
+        local = {endpoint: [] for endpoint in endpoints}
+        local_errors = {endpoint: 0 for endpoint in endpoints}
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            started = time.perf_counter()
+            response = make_request(client, endpoint, rng, args, titles, file_ids)
+            response.get_data()
+            local[endpoint].append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                local_errors[endpoint] += 1
+            response.close()
+        with lock:
+            for endpoint in endpoints:
+                samples[endpoint].extend(local[endpoint])
+                errors[endpoint] += local_errors[endpoint]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.seed, args.seed + args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for endpoint in endpoints:
+        latencies = sorted(samples[endpoint])
+        report[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors[endpoint],
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return report, elapsed
+
+
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    regressed = []
+    print(f"\n{'endpoint':<24}{'p95 before':>12}{'p95 after':>12}{'change':>10}{'rps change':>12}")
+    for endpoint, current in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before or not before['p95_ms']:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        rps_change = (current['rps'] - before['rps']) / before['rps'] * 100 if before['rps'] else 0.0
+        print(f"{endpoint:<24}{before['p95_ms']:>12}{current['p95_ms']:>12}{change:>9.1f}%{rps_change:>11.1f}%")
+        if change > max_regression:
+            regressed.append(endpoint)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongod', help='Start a throwaway mongod from this binary instead of using MONGO_URI.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--titles', type=int, default=8, help='Image set titles per level and category.')
+    parser.add_argument('--titles-per-user', type=int, default=None,
+                        help='Titles with progress per user and category (default: all). '
+                             'Answers to the remaining titles exercise the 404 path.')
+    parser.add_argument('--puzzles', type=int, default=10, help='Puzzles per title.')
+    parser.add_argument('--image-size', type=int, default=128, help='Side of the seeded PNGs in pixels.')
+    parser.add_argument('--layout', choices=['progress', 'legacy'], default='progress',
+                        help='Seed puzzle_progress documents, or legacy users.PuzzleArena trees.')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of traffic to replay.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against.')
+    parser.add_argument('--max-regression', type=float, default=10.0, help='Allowed p95 increase in percent.')
+    parser.add_argument('--keep', action='store_true', help='Keep the seeded database afterwards.')
+    args = parser.parse_args()
+
+    mongod = dbpath = None
+    if args.mongod:
+        mongod, dbpath, mongo_uri = start_mongod(args.mongod)
+    elif os.getenv('MONGO_URI'):
+        mongo_uri = os.environ['MONGO_URI']
+    else:
+        parser.error('Pass --mongod or set MONGO_URI to a local MongoDB')
+
+    smtp = serve_in_background(SMTPSink(free_port()))
+    stripe = serve_in_background(ThreadingHTTPServer(('127.0.0.1', free_port()), StripeStubHandler))
+    db_name = f'loadtest_{int(time.time())}'
+
+    # app.config reads the environment when it is first imported
+    os.environ.update({
+        'MONGO_URI': mongo_uri,
+        'MONGO_DB_NAME': db_name,
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': str(smtp.server_address[1]),
+        'SMTP_STARTTLS': 'false',
+        'SENDER_PASSWORD': '',
+        'STRIPE_API_BASE': f'http://127.0.0.1:{stripe.server_address[1]}',
+        'STRIPE_SECRET_KEY': 'sk_test_loadtest',
+        'PAYMENT_LINK': 'plink_loadtest',
+    })
+    sys.path.insert(0, ROOT)
+    from app import create_app, database
+
+    try:
+        app = create_app()
+        rng = random.Random(args.seed)
+        seed_started = time.perf_counter()
+        titles, file_ids = seed(database.db, database.fs, args, rng)
+        print(f"Seeded {args.users} users and {len(file_ids)} images in {time.perf_counter() - seed_started:.1f}s")
+
+        report, elapsed = replay(app, args, titles, file_ids)
+        results = {
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'mongod')},
+            'elapsed_seconds': round(elapsed, 2),
+            'total_rps': round(sum(row['requests'] for row in report.values()) / elapsed, 1),
+            'emails_delivered': smtp.messages,
+            'endpoints': report,
+        }
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as handle:
+                json.dump(results, handle, indent=2)
+
+        regressed = compare(results, args.compare, args.max_regression) if args.compare else []
+        if regressed:
+            print(f"REGRESSED p95: {', '.join(regressed)}")
+            sys.exit(1)
+    finally:
+        if not args.keep and database.client is not None:
+            database.client.drop_database(db_name)
+        smtp.shutdown()
+        stripe.shutdown()
+        if mongod:
+            mongod.terminate()
+            mongod.wait()
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""LRUCache: eviction, TTL, generations and counters."""
+import unittest
+from unittest import mock
+
+from app.utils.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch('app.utils.cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1)
+        with mock.patch('app.utils.cache.time.monotonic', return_value=109.9):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('app.utils.cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.stats()['size'], 0)
+
+    def test_fill_from_before_an_invalidation_is_dropped(self):
+        cache = LRUCache()
+        generation = cache.generation()
+        cache.invalidate('a')
+        cache.set('a', 'stale', generation)
+        self.assertIsNone(cache.get('a'))
+
+        generation = cache.generation()
+        cache.set('a', 'fresh', generation)
+        self.assertEqual(cache.get('a'), 'fresh')
+
+    def test_clear_also_moves_the_generation(self):
+        cache = LRUCache()
+        generation = cache.generation()
+        cache.set('a', 1)
+        cache.clear()
+        cache.set('b', 2, generation)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_hit_and_miss_counters(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['hit_ratio'], round(2 / 3, 4))
+
+    def test_peek_leaves_counters_and_order_alone(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertIsNone(cache.peek('missing'))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+        # 'a' was only peeked at, so it is still the oldest
+        cache.set('c', 3)
+        self.assertIsNone(cache.peek('a'))
+
+    def test_peek_ignores_expired_entries(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch('app.utils.cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1)
+        with mock.patch('app.utils.cache.time.monotonic', return_value=200.0):
+            self.assertIsNone(cache.peek('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""release_blobs reference counting, against an in-memory mongomock database."""
+import unittest
+
+import mongomock
+from bson import ObjectId
+
+from app.utils.gridfs_utils import release_blob, release_blobs
+
+
+class ReleaseBlobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+
+    def blob(self, refcount=1, variants=None, legacy=False):
+        file_id = ObjectId()
+        doc = {'_id': file_id, 'filename': 'board.png'}
+        if not legacy:
+            doc['refcount'] = refcount
+        if variants:
+            doc['variants'] = variants
+        self.db.fs.files.insert_one(doc)
+        self.db.fs.chunks.insert_one({'files_id': file_id, 'n': 0, 'data': b'x'})
+        return file_id
+
+    def exists(self, file_id):
+        return self.db.fs.files.count_documents({'_id': file_id}) == 1
+
+    def chunks(self, file_id):
+        return self.db.fs.chunks.count_documents({'files_id': file_id})
+
+    def test_shared_blob_survives_until_the_last_reference(self):
+        file_id = self.blob(refcount=2)
+        self.assertEqual(release_blobs(self.db, [file_id]), [])
+        self.assertTrue(self.exists(file_id))
+        self.assertEqual(self.db.fs.files.find_one({'_id': file_id})['refcount'], 1)
+
+        self.assertEqual(release_blobs(self.db, [file_id]), [])
+        self.assertFalse(self.exists(file_id))
+        self.assertEqual(self.chunks(file_id), 0)
+
+    def test_an_id_listed_twice_drops_two_references(self):
+        twice = self.blob(refcount=2)
+        kept = self.blob(refcount=3)
+        release_blobs(self.db, [twice, kept, twice])
+        self.assertFalse(self.exists(twice))
+        self.assertEqual(self.db.fs.files.find_one({'_id': kept})['refcount'], 2)
+        self.assertEqual(self.chunks(kept), 1)
+
+    def test_blob_without_refcount_counts_as_one_reference(self):
+        file_id = self.blob(legacy=True)
+        release_blobs(self.db, [file_id])
+        self.assertFalse(self.exists(file_id))
+        self.assertEqual(self.chunks(file_id), 0)
+
+    def test_variants_go_with_their_original(self):
+        thumbnail = self.blob()
+        original = self.blob(variants={'thumb': thumbnail})
+        release_blobs(self.db, [original])
+        self.assertFalse(self.exists(original))
+        self.assertFalse(self.exists(thumbnail))
+        self.assertEqual(self.chunks(thumbnail), 0)
+
+    def test_missing_ids_are_reported(self):
+        file_id = self.blob(refcount=2)
+        missing = ObjectId()
+        self.assertEqual(release_blobs(self.db, [file_id, missing]), [missing])
+        self.assertEqual(release_blobs(self.db, []), [])
+
+    def test_release_blob(self):
+        file_id = self.blob()
+        self.assertTrue(release_blob(self.db, file_id))
+        self.assertFalse(release_blob(self.db, file_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Outbox claiming, retry backoff and delivery, against an in-memory mongomock database."""
+import smtplib
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import mongomock
+
+from app import database
+from app.config import config
+from app.utils import outbox
+
+
+class FakeConnection:
+    """Stands in for SMTPConnection; addresses in `refuse` or `fail` raise."""
+
+    def __init__(self, refuse=(), fail=()):
+        self.refuse = set(refuse)
+        self.fail = set(fail)
+        self.sent = []
+        self.closed = 0
+
+    def send(self, email, message):
+        if email in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({email: (550, b'No such user')})
+        if email in self.fail:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(email)
+
+    def close(self):
+        self.closed += 1
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(database, 'db', mongomock.MongoClient().db),
+            mock.patch.object(config, 'EMAIL_WORKER_ENABLED', False),
+            mock.patch.object(config, 'EMAIL_SEND_INLINE', False),
+            mock.patch.object(config, 'MAX_RETRIES', 3),
+            mock.patch.object(config, 'RETRY_DELAY_SECONDS', 10),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def message(self, message_id):
+        return database.db.email_outbox.find_one({'_id': message_id})
+
+    def make_due(self, message_id):
+        database.db.email_outbox.update_one(
+            {'_id': message_id}, {'$set': {'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)}})
+
+    def test_enqueue_stores_a_pending_message(self):
+        message_id = outbox.enqueue_email('a@example.com', 'Hi', 'Body', kind='otp')
+        message = self.message(message_id)
+        self.assertEqual(message['status'], 'pending')
+        self.assertEqual(message['attempts'], 0)
+        self.assertEqual((message['to'], message['kind']), ('a@example.com', 'otp'))
+
+    def test_delivery_marks_sent(self):
+        ids = [outbox.enqueue_email(f'{i}@example.com', 'Hi', 'Body') for i in range(3)]
+        connection = FakeConnection()
+        self.assertEqual(outbox.deliver_pending(connection), {'sent': 3, 'failed': 0})
+        self.assertEqual(connection.sent, [f'{i}@example.com' for i in range(3)])
+        for message_id in ids:
+            self.assertEqual(self.message(message_id)['status'], 'sent')
+            self.assertEqual(self.message(message_id)['attempts'], 1)
+
+    def test_limit(self):
+        for i in range(3):
+            outbox.enqueue_email(f'{i}@example.com', 'Hi', 'Body')
+        self.assertEqual(outbox.deliver_pending(FakeConnection(), limit=2), {'sent': 2, 'failed': 0})
+        self.assertEqual(outbox.deliver_pending(FakeConnection()), {'sent': 1, 'failed': 0})
+
+    def test_backoff_doubles_until_max_retries(self):
+        message_id = outbox.enqueue_email('flaky@example.com', 'Hi', 'Body')
+        connection = FakeConnection(fail={'flaky@example.com'})
+
+        for attempt, delay in ((1, 10), (2, 20)):
+            before = datetime.utcnow()
+            self.assertEqual(outbox.deliver_pending(connection), {'sent': 0, 'failed': 1})
+            message = self.message(message_id)
+            self.assertEqual((message['status'], message['attempts']), ('pending', attempt))
+            self.assertIn('unexpectedly closed', message['last_error'])
+            wait = (message['next_attempt_at'] - before).total_seconds()
+            self.assertAlmostEqual(wait, delay, delta=1)
+            # Not due yet: nothing is claimed
+            self.assertEqual(outbox.deliver_pending(connection), {'sent': 0, 'failed': 0})
+            self.make_due(message_id)
+
+        outbox.deliver_pending(connection)
+        message = self.message(message_id)
+        self.assertEqual((message['status'], message['attempts']), ('failed', 3))
+        # The session was dropped after each transient failure
+        self.assertEqual(connection.closed, 3)
+
+    def test_refused_recipient_fails_at_once(self):
+        message_id = outbox.enqueue_email('gone@example.com', 'Hi', 'Body')
+        connection = FakeConnection(refuse={'gone@example.com'})
+        self.assertEqual(outbox.deliver_pending(connection), {'sent': 0, 'failed': 1})
+        self.assertEqual(self.message(message_id)['status'], 'failed')
+        self.assertEqual(connection.closed, 0)
+
+    def test_expired_lease_is_claimed_again(self):
+        message_id = outbox.enqueue_email('a@example.com', 'Hi', 'Body')
+        database.db.email_outbox.update_one(
+            {'_id': message_id},
+            {'$set': {'status': 'sending', 'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)}})
+        self.assertEqual(outbox.deliver_pending(FakeConnection()), {'sent': 1, 'failed': 0})
+
+    def test_send_through_outbox_reports_inline_delivery(self):
+        connection = FakeConnection(fail={'down@example.com'})
+        with mock.patch.object(config, 'EMAIL_SEND_INLINE', True), \
+                mock.patch.object(outbox, 'SMTPConnection', return_value=connection), \
+                mock.patch.object(outbox, '_inline_connection', None):
+            sent_id, sent = outbox.send_through_outbox('a@example.com', 'Hi', 'Body')
+            queued_id, queued_sent = outbox.send_through_outbox('down@example.com', 'Hi', 'Body')
+        self.assertTrue(sent)
+        self.assertEqual(self.message(sent_id)['status'], 'sent')
+        self.assertFalse(queued_sent)
+        self.assertEqual(self.message(queued_id)['status'], 'pending')
+
+    def test_enqueue_many(self):
+        self.assertEqual(outbox.enqueue_many(['a@example.com', 'b@example.com'], 'Hi', 'Body'), 2)
+        self.assertEqual(database.db.email_outbox.count_documents({'status': 'pending'}), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
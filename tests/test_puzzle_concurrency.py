@@ -0,0 +1,205 @@
+"""Concurrent /update_puzzle_started requests against a real mongod.
+
+Uses MONGO_TEST_URI when set, otherwise starts a throwaway mongod from
+$MONGOD or the PATH. Skipped when neither is available. Run with
+`python -m pytest tests` or `python -m unittest discover tests`.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+THREADS = 16
+CATEGORY = 'Opening'
+
+_mongod = None
+_dbpath = None
+app = None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_mongod(binary):
+    global _mongod, _dbpath
+    _dbpath = tempfile.mkdtemp(prefix='test-mongod-')
+    port = _free_port()
+    _mongod = subprocess.Popen(
+        [binary, '--dbpath', _dbpath, '--port', str(port), '--bind_ip', '127.0.0.1', '--quiet'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return f'mongodb://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    raise unittest.SkipTest('mongod did not start within 30 seconds')
+
+
+def setUpModule():
+    global app
+    uri = os.getenv('MONGO_TEST_URI')
+    if not uri:
+        binary = os.getenv('MONGOD') or shutil.which('mongod')
+        if not binary:
+            raise unittest.SkipTest('set MONGO_TEST_URI or put mongod on the PATH')
+        uri = _start_mongod(binary)
+
+    # Config is read once at import, so the environment is set up first
+    os.environ['MONGO_URI'] = uri
+    os.environ['MONGO_DB_NAME'] = f'test_puzzles_{uuid.uuid4().hex[:8]}'
+    os.environ['EMAIL_WORKER_ENABLED'] = 'false'
+    os.environ['METRICS_ENABLED'] = 'false'
+    os.environ['SLOW_QUERY_MONITOR'] = 'false'
+    os.environ['MONGO_MAX_POOL_SIZE'] = str(THREADS)
+
+    from app import create_app
+    app = create_app()
+
+
+def tearDownModule():
+    if app is not None:
+        from app import database
+        database.client.drop_database(database.db.name)
+    if _mongod is not None:
+        _mongod.terminate()
+        _mongod.wait(timeout=30)
+        shutil.rmtree(_dbpath, ignore_errors=True)
+
+
+class UpdatePuzzleStartedConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        from app import database
+        self.database = database
+        self.email = f'{uuid.uuid4().hex[:12]}@example.com'
+        self.title = 'Forks'
+        database.users_collection.insert_one({'email': self.email, 'name': 'Test', 'level': 'Beginner'})
+        client = app.test_client()
+        response = client.post('/create_Arena_user', json={
+            'email': self.email, 'category': CATEGORY, 'title': self.title, 'puzzle_no': THREADS,
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def answer(self, puzzle_no, **fields):
+        body = {'email': self.email, 'category': CATEGORY, 'title': self.title, 'puzzle_no': puzzle_no}
+        body.update(fields)
+        return app.test_client().post('/update_puzzle_started', json=body)
+
+    def answer_concurrently(self, answers):
+        """Send every (puzzle_no, fields) at once, one thread each, and return the status codes."""
+        barrier = threading.Barrier(len(answers))
+        statuses = [None] * len(answers)
+
+        def run(index, puzzle_no, fields):
+            barrier.wait()
+            statuses[index] = self.answer(puzzle_no, **fields).status_code
+
+        threads = [threading.Thread(target=run, args=(index, puzzle_no, fields))
+                   for index, (puzzle_no, fields) in enumerate(answers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def puzzles(self):
+        doc = self.database.db.puzzle_progress.find_one(
+            {'email': self.email, 'category': CATEGORY, 'title': self.title})
+        return doc['puzzles']
+
+    def category_score(self):
+        user = self.database.users_collection.find_one({'email': self.email}, {'scores': 1})
+        return (user.get('scores') or {}).get(CATEGORY, 0)
+
+    def assertScoreMatchesProgress(self):
+        stored = sum(puzzle.get('score') or 0 for puzzle in self.puzzles().values())
+        self.assertEqual(self.category_score(), stored)
+
+    def test_answers_to_every_puzzle_of_a_title_all_land(self):
+        answers = [(f'Puzzle{i}', {'score': i % 2, 'option_guessed': True, 'timer': i})
+                   for i in range(1, THREADS + 1)]
+        self.assertEqual(self.answer_concurrently(answers), [200] * THREADS)
+
+        puzzles = self.puzzles()
+        for i in range(1, THREADS + 1):
+            puzzle = puzzles[f'Puzzle{i}']
+            self.assertTrue(puzzle['started'])
+            self.assertEqual(puzzle['timer'], i)
+            self.assertEqual(puzzle['score'], i % 2)
+            self.assertIs(puzzle['option_guessed'], True)
+        self.assertEqual(self.category_score(), THREADS // 2)
+        self.assertScoreMatchesProgress()
+
+    def test_answers_to_one_puzzle_count_a_solve_once(self):
+        answers = [('Puzzle1', {'score': i % 2, 'option_guessed': True, 'timer': i})
+                   for i in range(THREADS)]
+        self.assertEqual(self.answer_concurrently(answers), [200] * THREADS)
+
+        puzzle = self.puzzles()['Puzzle1']
+        self.assertTrue(puzzle['started'])
+        self.assertEqual(puzzle['score'], 1)
+        # Once solved nothing else is written, so the timer is a solving answer's
+        self.assertIn(puzzle['timer'], [i for i in range(THREADS) if i % 2])
+        self.assertEqual(self.category_score(), 1)
+        self.assertScoreMatchesProgress()
+
+    def test_solved_puzzle_is_never_overwritten(self):
+        self.assertEqual(self.answer('Puzzle1', score=1, option_guessed=True, timer=5).status_code, 200)
+
+        answers = [('Puzzle1', {'score': 0, 'option_guessed': False, 'timer': 100 + i})
+                   for i in range(THREADS)]
+        self.assertEqual(self.answer_concurrently(answers), [200] * THREADS)
+
+        puzzle = self.puzzles()['Puzzle1']
+        self.assertEqual(puzzle['score'], 1)
+        self.assertEqual(puzzle['timer'], 5)
+        self.assertIs(puzzle['option_guessed'], True)
+        self.assertEqual(self.category_score(), 1)
+        self.assertScoreMatchesProgress()
+
+    def test_stored_wrong_guess_forces_zero(self):
+        self.assertEqual(self.answer('Puzzle1', score=0, option_guessed=False, timer=5).status_code, 200)
+
+        answers = [('Puzzle1', {'score': 1, 'timer': 100 + i}) for i in range(THREADS)]
+        self.assertEqual(self.answer_concurrently(answers), [200] * THREADS)
+
+        puzzle = self.puzzles()['Puzzle1']
+        self.assertEqual(puzzle['score'], 0)
+        self.assertIs(puzzle['option_guessed'], False)
+        self.assertIn(puzzle['timer'], range(100, 100 + THREADS))
+        self.assertEqual(self.category_score(), 0)
+        self.assertScoreMatchesProgress()
+
+    def test_wrong_guesses_and_solves_on_several_puzzles(self):
+        for i in range(1, 5):
+            self.assertEqual(self.answer(f'Puzzle{i}', score=0, option_guessed=False, timer=1).status_code, 200)
+
+        answers = []
+        for i in range(1, 9):
+            answers += [(f'Puzzle{i}', {'score': 1, 'timer': 10 + i}),
+                        (f'Puzzle{i}', {'score': 1, 'timer': 20 + i})]
+        self.assertEqual(self.answer_concurrently(answers), [200] * len(answers))
+
+        puzzles = self.puzzles()
+        for i in range(1, 9):
+            puzzle = puzzles[f'Puzzle{i}']
+            self.assertTrue(puzzle['started'])
+            # Puzzles 1-4 had a wrong guess stored, 5-8 were solved
+            self.assertEqual(puzzle['score'], 0 if i <= 4 else 1)
+        self.assertEqual(self.category_score(), 4)
+        self.assertScoreMatchesProgress()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""window_query and start_queries on a bare Flask request context."""
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from flask import Flask
+
+from app.config import config
+from app.utils.schedule import MAX_LIMIT, start_queries, window_query
+
+flask_app = Flask(__name__)
+
+
+def window(query_string):
+    with flask_app.test_request_context(f'/sessions?{query_string}'):
+        return window_query()
+
+
+class WindowQueryTest(unittest.TestCase):
+
+    def test_no_parameters(self):
+        self.assertEqual(window(''), ({}, 0))
+
+    def test_from_is_inclusive_and_to_exclusive(self):
+        query, limit = window('from=2024-03-01&to=2024-04-01T00:00:00Z')
+        self.assertEqual(query, {'starts_at': {'$gte': datetime(2024, 3, 1), '$lt': datetime(2024, 4, 1)}})
+        self.assertEqual(limit, 0)
+
+    def test_limit_is_capped(self):
+        self.assertEqual(window('limit=10')[1], 10)
+        self.assertEqual(window(f'limit={MAX_LIMIT + 1}')[1], MAX_LIMIT)
+
+    def test_bad_limits(self):
+        for value in ('ten', '0', '-5'):
+            with self.assertRaises(ValueError):
+                window(f'limit={value}')
+
+    def test_bad_dates(self):
+        with self.assertRaises(ValueError):
+            window('from=soon')
+
+    def test_numeric_dates_follow_date_order(self):
+        with mock.patch.object(config, 'DATE_ORDER', 'MDY'):
+            self.assertEqual(window('from=05/03/2024')[0]['starts_at']['$gte'], datetime(2024, 5, 3))
+        with mock.patch.object(config, 'DATE_ORDER', 'DMY'):
+            self.assertEqual(window('from=05/03/2024')[0]['starts_at']['$gte'], datetime(2024, 3, 5))
+        with mock.patch.object(config, 'DATE_ORDER', 'STRICT'):
+            with self.assertRaises(ValueError):
+                window('from=05/03/2024')
+
+    def test_wall_clock_bounds_use_the_club_timezone(self):
+        with mock.patch.object(config, 'CLUB_TIMEZONE', 'America/New_York'):
+            self.assertEqual(window('from=2024-03-25')[0]['starts_at']['$gte'], datetime(2024, 3, 25, 4))
+
+
+class StartQueriesTest(unittest.TestCase):
+
+    def test_typed_start_first_then_the_strings(self):
+        self.assertEqual(start_queries('2024-03-25', '7 pm'), [
+            {'starts_at': datetime(2024, 3, 25, 19)},
+            {'date': '2024-03-25', 'time': '7 pm'},
+        ])
+
+    def test_unparseable_input_matches_the_strings_only(self):
+        self.assertEqual(start_queries('2024-03-25', '10:00 AM EST'),
+                         [{'date': '2024-03-25', 'time': '10:00 AM EST'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""verify_signature against Stripe-Signature headers built the way Stripe builds them."""
+import hashlib
+import hmac
+import time
+import unittest
+
+from app.utils.stripe_sync import verify_signature
+
+SECRET = 'whsec_test'
+PAYLOAD = b'{"id": "evt_1", "type": "checkout.session.completed"}'
+
+
+def sign(payload, timestamp, secret=SECRET):
+    signed = str(timestamp).encode() + b'.' + payload
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+
+class VerifySignatureTest(unittest.TestCase):
+
+    def test_valid_signature(self):
+        now = int(time.time())
+        header = f't={now},v1={sign(PAYLOAD, now)}'
+        self.assertTrue(verify_signature(PAYLOAD, header, SECRET))
+
+    def test_tampered_body(self):
+        now = int(time.time())
+        header = f't={now},v1={sign(PAYLOAD, now)}'
+        self.assertFalse(verify_signature(PAYLOAD.replace(b'evt_1', b'evt_2'), header, SECRET))
+
+    def test_wrong_secret(self):
+        now = int(time.time())
+        header = f't={now},v1={sign(PAYLOAD, now, secret="whsec_other")}'
+        self.assertFalse(verify_signature(PAYLOAD, header, SECRET))
+
+    def test_stale_timestamp(self):
+        then = int(time.time()) - 301
+        header = f't={then},v1={sign(PAYLOAD, then)}'
+        self.assertFalse(verify_signature(PAYLOAD, header, SECRET, tolerance=300))
+        self.assertTrue(verify_signature(PAYLOAD, header, SECRET, tolerance=600))
+
+    def test_timestamp_is_part_of_the_signature(self):
+        now = int(time.time())
+        header = f't={now - 1},v1={sign(PAYLOAD, now)}'
+        self.assertFalse(verify_signature(PAYLOAD, header, SECRET))
+
+    def test_multiple_v1_signatures(self):
+        # During secret rotation Stripe signs with every active secret
+        now = int(time.time())
+        header = f't={now},v1={sign(PAYLOAD, now, secret="whsec_old")},v1={sign(PAYLOAD, now)},v0=ignored'
+        self.assertTrue(verify_signature(PAYLOAD, header, SECRET))
+
+    def test_malformed_headers(self):
+        now = int(time.time())
+        for header in (None, '', f't={now}', f'v1={sign(PAYLOAD, now)}', f't=soon,v1={sign(PAYLOAD, now)}'):
+            self.assertFalse(verify_signature(PAYLOAD, header, SECRET), header)
+
+    def test_missing_secret(self):
+        now = int(time.time())
+        self.assertFalse(verify_signature(PAYLOAD, f't={now},v1={sign(PAYLOAD, now)}', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""parse_datetime: accepted formats, day/month order, time zones."""
+import unittest
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from time_utils import parse_datetime
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_unambiguous_formats(self):
+        expected = datetime(2024, 3, 25)
+        for value in ('2024-03-25', '2024/03/25', '25-03-2024', '25/03/2024', '03/25/2024',
+                      '03-25-2024', '25 March 2024', '25 Mar 2024', 'March 25, 2024', 'Mar 25 2024'):
+            self.assertEqual(parse_datetime(value), expected, value)
+
+    def test_ambiguous_numeric_dates_are_rejected_without_an_order(self):
+        for value in ('05/03/2024', '05-03-2024'):
+            self.assertIsNone(parse_datetime(value), value)
+
+    def test_day_first_and_month_first(self):
+        for value in ('05/03/2024', '05-03-2024'):
+            self.assertEqual(parse_datetime(value, day_first=True), datetime(2024, 3, 5), value)
+            self.assertEqual(parse_datetime(value, day_first=False), datetime(2024, 5, 3), value)
+
+    def test_both_readings_agree(self):
+        self.assertEqual(parse_datetime('05/05/2024'), datetime(2024, 5, 5))
+
+    def test_only_one_reading_is_a_date(self):
+        # 25 cannot be a month, whatever the configured order
+        self.assertEqual(parse_datetime('25/03/2024', day_first=False), datetime(2024, 3, 25))
+        self.assertEqual(parse_datetime('03/25/2024', day_first=True), datetime(2024, 3, 25))
+
+    def test_unparseable(self):
+        for value in (None, '', '   ', 'soon', '31/02/2024', 42):
+            self.assertIsNone(parse_datetime(value), value)
+
+
+class ParseTimeTest(unittest.TestCase):
+
+    def test_time_formats(self):
+        for value in ('19:30', '19:30:00', '7:30 pm', '7:30PM', '07:30:00 PM'):
+            self.assertEqual(parse_datetime('2024-03-25', value), datetime(2024, 3, 25, 19, 30), value)
+        self.assertEqual(parse_datetime('2024-03-25', '7 pm'), datetime(2024, 3, 25, 19))
+
+    def test_missing_time_is_midnight(self):
+        self.assertEqual(parse_datetime('2024-03-25', None), datetime(2024, 3, 25))
+        self.assertEqual(parse_datetime('2024-03-25', ' '), datetime(2024, 3, 25))
+
+    def test_unparseable_time(self):
+        self.assertIsNone(parse_datetime('2024-03-25', '10:00 AM EST'))
+        self.assertIsNone(parse_datetime('2024-03-25', 1900))
+
+
+class TimeZoneTest(unittest.TestCase):
+
+    def test_offsets_are_converted_to_utc(self):
+        self.assertEqual(parse_datetime('2024-03-25T19:30:00+02:00'), datetime(2024, 3, 25, 17, 30))
+        self.assertEqual(parse_datetime('2024-03-25T19:30:00Z'), datetime(2024, 3, 25, 19, 30))
+
+    def test_wall_clock_values_are_read_in_the_given_zone(self):
+        new_york = ZoneInfo('America/New_York')
+        self.assertEqual(parse_datetime('2024-03-25', '7:30 pm', tz=new_york), datetime(2024, 3, 25, 23, 30))
+        # An explicit offset wins over the zone
+        self.assertEqual(parse_datetime('2024-03-25T19:30:00Z', tz=new_york), datetime(2024, 3, 25, 19, 30))
+
+    def test_one_clock_for_both_kinds_of_input(self):
+        tz = timezone(timedelta(hours=5, minutes=30))
+        self.assertEqual(parse_datetime('2024-03-25', '19:30', tz=tz),
+                         parse_datetime('2024-03-25T19:30:00+05:30', tz=tz))
+
+    def test_datetimes_pass_through_as_naive_utc(self):
+        naive = datetime(2024, 3, 25, 19, 30)
+        self.assertIs(parse_datetime(naive), naive)
+        aware = datetime(2024, 3, 25, 19, 30, tzinfo=timezone(timedelta(hours=-4)))
+        self.assertEqual(parse_datetime(aware), datetime(2024, 3, 25, 23, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
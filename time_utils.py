@@ -1,8 +1,77 @@
 from flask import jsonify
-from datetime import datetime
+from datetime import datetime, timezone
+
+# Formats the admin UI has used for dates and times. Numeric dates such as
+# 05/03/2024 read differently day-first and month-first, so they are kept
+# apart and parsed in an explicit order (see parse_datetime)
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d',
+                '%d %B %Y', '%d %b %Y', '%B %d, %Y', '%b %d, %Y', '%B %d %Y', '%b %d %Y']
+DAY_FIRST_FORMATS = ['%d-%m-%Y', '%d/%m/%Y']
+MONTH_FIRST_FORMATS = ['%m-%d-%Y', '%m/%d/%Y']
+TIME_FORMATS = ['%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I:%M:%S %p', '%I %p', '%I%p']
 
 def time_now():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 def serve_time():
     return jsonify({"time": time_now()})
+
+def _parse(value, formats):
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+def _parse_date(value, day_first=None):
+    parsed = _parse(value, DATE_FORMATS)
+    if parsed is not None:
+        return parsed
+    day_month = _parse(value, DAY_FIRST_FORMATS)
+    month_day = _parse(value, MONTH_FIRST_FORMATS)
+    if day_month is None or month_day is None or day_month == month_day:
+        # Only one reading is a real date (25/03/2024), or both agree
+        return day_month or month_day
+    if day_first is None:
+        return None
+    return day_month if day_first else month_day
+
+def parse_datetime(date, time=None, day_first=None, tz=None):
+    """Combine free-form date and time strings into a naive UTC datetime.
+
+    `date` may also be a full ISO 8601 timestamp; its offset is honoured.
+    Values without an offset are wall-clock times in `tz` (a tzinfo, UTC
+    when None), so every result is on the same UTC clock. A missing time
+    means midnight. Numeric dates that read differently both ways are
+    taken day-first or month-first per `day_first`; with None they are
+    ambiguous. Returns None when either part cannot be parsed or the date
+    is ambiguous.
+    """
+    if isinstance(date, datetime):
+        # Stored starts_at values come back from MongoDB as naive UTC
+        if date.tzinfo is None:
+            return date
+        return date.astimezone(timezone.utc).replace(tzinfo=None)
+    if not isinstance(date, str) or not date.strip():
+        return None
+    date = date.strip()
+
+    try:
+        parsed = datetime.fromisoformat(date.replace('Z', '+00:00'))
+    except ValueError:
+        parsed = _parse_date(date, day_first)
+    if parsed is None:
+        return None
+
+    if time is not None and not (isinstance(time, str) and not time.strip()):
+        if not isinstance(time, str):
+            return None
+        clock = _parse(time.strip().upper(), TIME_FORMATS)
+        if clock is None:
+            return None
+        parsed = parsed.replace(hour=clock.hour, minute=clock.minute, second=clock.second, microsecond=0)
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz or timezone.utc)
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)